@@ -1,8 +1,15 @@
 import pandas as pd
 import numpy as np
+import warnings
 import matplotlib.pyplot as plt
 import seaborn as sns
 
+# Basepath events that result in an out
+BASEPATH_OUTS = [
+    'caught_stealing_3b', 'caught_stealing_2b', 'pickoff_caught_stealing_2b', 'pickoff_2b',
+    'pickoff_caught_stealing_3b', 'pickoff_1b', 'caught_stealing_home', 'pickoff_3b', 'pickoff_caught_stealing_home'
+]
+
 # Calculates how many pa and bf every player had per year
 def compute_player_pa_and_bf(df_players, at_bat_ids, df_savant):
 
@@ -16,14 +23,8 @@ def compute_player_pa_and_bf(df_players, at_bat_ids, df_savant):
     df_players = df_players.merge(bf_counts, left_on=['player_mlb_id', 'year'], right_on=['pitcher', 'year'], how='left').drop(columns='pitcher')
     df_players['total_bf'] = df_players['total_bf'].fillna(0).astype(int)
     
-    # Define basepath outs that result in an out
-    basepath_outs = [
-        'caught_stealing_3b', 'caught_stealing_2b', 'pickoff_caught_stealing_2b', 'pickoff_2b',
-        'pickoff_caught_stealing_3b', 'pickoff_1b', 'caught_stealing_home', 'pickoff_3b', 'pickoff_caught_stealing_home'
-    ]
-
     # Filter for basepath events that ended an inning (2 outs when the event occurred)
-    df_basepath_ends_inning = df_savant[(df_savant['outs_when_up'] == 2) & (df_savant['events'].isin(basepath_outs))]
+    df_basepath_ends_inning = df_savant[(df_savant['outs_when_up'] == 2) & (df_savant['events'].isin(BASEPATH_OUTS))]
     count_basepath_ended_ab = df_basepath_ends_inning.groupby(['batter', 'year'])['at_bat_id'].nunique().reset_index(name='base_ended_inn')
 
     # Merge basepath-ended inning counts and adjust plate appearances
@@ -33,42 +34,133 @@ def compute_player_pa_and_bf(df_players, at_bat_ids, df_savant):
 
     return df_players
 
+#list of each position column name
+FIELDING_COLUMNS = ['pitcher_1', 'fielder_2_1', 'fielder_3', 
+                    'fielder_4', 'fielder_5', 'fielder_6',
+                    'fielder_7', 'fielder_8', 'fielder_9']
+
+#dictionary to change position column to more recognizable name
+FIELDING_DICT = {'pitcher_1':'p', 'fielder_2_1':'c', 'fielder_3':'1b', 
+                 'fielder_4':'2b', 'fielder_5':'3b', 'fielder_6':'ss',
+                 'fielder_7':'lf', 'fielder_8':'cf', 'fielder_9':'rf'}
+
+#savant columns the per player game table is built from
+PLAYER_GAME_COLUMNS = ['game_pk', 'inning_topbot', 'at_bat_number', 'role_key', 'pitcher_at_bat_number'] + FIELDING_COLUMNS
+
+#one row per player per game: lineup slot, pitching role, batters faced and fielding positions
+def build_player_game_table(df_savant):
+    """
+    Builds the per-player-game table that the lineup, role, batters faced and fielding
+    season features are reduced from.
+
+    The pitch table is sorted once by (game_pk, year, inning_topbot, at_bat_number), so the
+    lineup slot of a batter is the order of their first plate appearance within their half of the
+    game. year is constant within a game unless it carries split groups (build_split_features).
+    Roles, batters faced and fielding positions come from vectorized keyed reductions over the
+    same columns, keeping the first-row semantics of the original season functions.
+
+    Parameters:
+    -----------
+    df_savant : pandas.DataFrame
+        Cleaned Baseball Savant pitch data with 'at_bat_id', 'game_pk', 'inning_topbot',
+        'at_bat_number', 'role_key', 'pitcher_at_bat_number' and the fielding columns.
+
+    Returns:
+    --------
+    pandas.DataFrame
+        One row per (player_mlb_id, game_pk, year) with 'lineup_slot' (NaN if the player
+        did not bat), 'lineup_halves' (halves of the game the player batted in, normally 0 or 1), 'role' (first non-null role_key of the pitcher in the game),
+        'batters_faced', 'bf_sum' and 'bf_count' (sum and count of the per at-bat
+        pitcher_at_bat_number maxima) and one 'field_<position>' count per position.
+    """
+    keys = ['player_mlb_id', 'game_pk', 'year']
+    game_pk = df_savant['game_pk'].to_numpy()
+    year = df_savant['year'].to_numpy()
+    half_codes = pd.factorize(df_savant['inning_topbot'])[0]
+
+    #single stable sort; pitches of the same at bat keep their file order
+    order = np.lexsort((df_savant['at_bat_number'].to_numpy(), half_codes, year, game_pk))
+    game_sorted = game_pk[order]
+    year_sorted = year[order]
+    half_sorted = half_codes[order]
+    batter_sorted = df_savant['batter'].to_numpy()[order]
+
+    #number every half of every game, then keep each batter's first pitch within it
+    new_half = np.ones(len(order), dtype=bool)
+    new_half[1:] = ((game_sorted[1:] != game_sorted[:-1]) | (year_sorted[1:] != year_sorted[:-1])
+                    | (half_sorted[1:] != half_sorted[:-1]))
+    half_id = np.cumsum(new_half)
+    first_pa = ~pd.DataFrame({'half': half_id, 'batter': batter_sorted}).duplicated().to_numpy()
+
+    #lineup slot is the position of that first pitch among the half's first pitches
+    first_half_id = half_id[first_pa]
+    first_position = np.arange(len(first_half_id))
+    new_first_half = np.ones(len(first_half_id), dtype=bool)
+    new_first_half[1:] = first_half_id[1:] != first_half_id[:-1]
+    half_start = np.maximum.accumulate(np.where(new_first_half, first_position, 0))
+    df_lineup = pd.DataFrame({'player_mlb_id': batter_sorted[first_pa], 'game_pk': game_sorted[first_pa],
+                              'year': year_sorted[first_pa], 'lineup_slot': first_position - half_start + 1})
+    df_lineup = df_lineup.groupby(keys, sort=False)['lineup_slot'].agg(['mean', 'size']).reset_index()
+    df_lineup.columns = keys + ['lineup_slot', 'lineup_halves']
+
+    #role of every pitching appearance is the first non-null role_key in file order
+    df_roles = pd.DataFrame({'player_mlb_id': df_savant['pitcher'].to_numpy(), 'game_pk': game_pk, 'year': year,
+                             'role': df_savant['role_key'].to_numpy()})
+    df_pitching = df_roles[keys].drop_duplicates().merge(
+        df_roles[df_roles['role'].notna()].drop_duplicates(keys), on=keys, how='left')
+
+    #batters faced: highest pitcher_at_bat_number of every at bat, credited to the game it started in
+    df_at_bats = pd.DataFrame({'player_mlb_id': df_savant['pitcher'].to_numpy(), 'at_bat_id': df_savant['at_bat_id'].to_numpy(),
+                               'game_pk': game_pk, 'year': year, 'bf': df_savant['pitcher_at_bat_number'].to_numpy()})
+    df_at_bats = df_at_bats.groupby(['player_mlb_id', 'year', 'at_bat_id'], sort=False).agg(game_pk=('game_pk', 'first'), bf=('bf', 'max'))
+    df_bf = df_at_bats.reset_index().groupby(keys, sort=False)['bf'].agg(['size', 'sum', 'count']).reset_index()
+    df_bf.columns = keys + ['batters_faced', 'bf_sum', 'bf_count']
+    df_pitching = df_pitching.merge(df_bf, on=keys, how='left')
+
+    #distinct fielding alignments per at bat, stacked into one (player, game, position) column set
+    df_fielding = df_savant[['at_bat_id', 'year', 'game_pk'] + FIELDING_COLUMNS].drop_duplicates(['at_bat_id', 'year'] + FIELDING_COLUMNS)
+    field_columns = ['field_' + FIELDING_DICT[col] for col in FIELDING_COLUMNS]
+    df_positions = pd.DataFrame({
+        'player_mlb_id': np.concatenate([df_fielding[col].to_numpy() for col in FIELDING_COLUMNS]),
+        'game_pk': np.tile(df_fielding['game_pk'].to_numpy(), len(FIELDING_COLUMNS)),
+        'year': np.tile(df_fielding['year'].to_numpy(), len(FIELDING_COLUMNS)),
+        'position': np.repeat(np.arange(len(FIELDING_COLUMNS)), len(df_fielding)),
+    }).dropna(subset=['player_mlb_id'])
+    df_positions['player_mlb_id'] = df_positions['player_mlb_id'].astype(np.int64)
+    df_positions = df_positions.groupby(keys + ['position']).size().unstack(fill_value=0)
+    df_positions = df_positions.reindex(columns=range(len(FIELDING_COLUMNS)), fill_value=0)
+    df_positions.columns = field_columns
+
+    #join the three views
+    df_games = df_lineup.merge(df_pitching, on=keys, how='outer').merge(df_positions.reset_index(), on=keys, how='outer')
+    for col in ['lineup_halves', 'batters_faced', 'bf_count'] + field_columns:
+        df_games[col] = df_games[col].fillna(0).astype(int)
+
+    return df_games[keys + ['lineup_slot', 'lineup_halves', 'role', 'batters_faced', 'bf_sum', 'bf_count'] + field_columns]
+
 #counts how many times a player played at every fielding position
-def get_fielding_counts(df_players, df_savant):
-    #get the fielders for every at bat
-    df_savant_fielding = df_savant[['at_bat_id','year','pitcher_1',
-        'fielder_2_1', 'fielder_3', 'fielder_4', 'fielder_5', 'fielder_6',
-        'fielder_7', 'fielder_8', 'fielder_9']].drop_duplicates()
-
-    #list of each position column name
-    fielding_columns = ['pitcher_1', 'fielder_2_1', 'fielder_3', 
-                        'fielder_4', 'fielder_5', 'fielder_6',
-                        'fielder_7', 'fielder_8', 'fielder_9']
-    
-    #dictionary to change position column to more recognizable name
-    fielding_dict = {'pitcher_1':'p', 'fielder_2_1':'c', 'fielder_3':'1b', 
-                     'fielder_4':'2b', 'fielder_5':'3b', 'fielder_6':'ss',
-                     'fielder_7':'lf', 'fielder_8':'cf', 'fielder_9':'rf'}
-    
-    #get count for every player at every position
-    for col in fielding_columns:
-        col_name = 'field_' + fielding_dict[col]
-        count_df = df_savant_fielding.groupby([col, 'year']).size().reset_index(name=col_name)
-        
-        #add count to main dataframe
-        df_players = df_players.merge(count_df, how='left', left_on=['player_mlb_id', 'year'], right_on=[col, 'year']).drop(columns=col)
-        
-        #fill NaN with 0
-        df_players[col_name] = df_players[col_name].fillna(0).astype(int)
+def get_fielding_counts(df_players, df_savant, df_games=None):
+    if df_games is None:
+        df_games = build_player_game_table(df_savant)
+
+    #sum the per game position counts over the season
+    field_columns = ['field_' + FIELDING_DICT[col] for col in FIELDING_COLUMNS]
+    df_field = df_games.groupby(['player_mlb_id', 'year'])[field_columns].sum().reset_index()
+
+    #add counts to main dataframe, 0 for players who never took the field
+    df_players = df_players.merge(df_field, how='left', on=['player_mlb_id', 'year'])
+    df_players[field_columns] = df_players[field_columns].fillna(0).astype(int)
 
     return df_players
 
 #calculate the percent of pitching appearances that were as a starter vs as a reliever
-def add_sp_percentage(df_players, df_savant):
-    grouped_df = df_savant.groupby(['pitcher', 'game_pk'])['role_key'].first().reset_index()
+def add_sp_percentage(df_players, df_savant, df_games=None):
+    if df_games is None:
+        df_games = build_player_game_table(df_savant)
+    df_games = df_games[df_games['role'].notna()]
 
-    sp_count = grouped_df.groupby('pitcher')['role_key'].apply(lambda x: (x == 'SP').sum())
-    total_count = grouped_df.groupby('pitcher')['role_key'].count()
+    sp_count = (df_games['role'] == 'SP').groupby(df_games['player_mlb_id']).sum()
+    total_count = df_games.groupby('player_mlb_id').size()
     sp_percentage = (sp_count / total_count) * 100
 
     df_players = df_players.merge(sp_percentage.rename('sp_pct'), left_on='player_mlb_id', right_index=True, how='left')
@@ -81,9 +173,12 @@ def add_sp_percentage(df_players, df_savant):
     return df_players
 
 #average how many batters a picther faced in an outing
-def calculate_batters_faced_in_game(df_players,df_savant):
-    df_bf_per_app = df_savant.groupby(['pitcher', 'year','at_bat_id'])['pitcher_at_bat_number'].max().reset_index().groupby(['pitcher', 'year'])['pitcher_at_bat_number'].mean().reset_index(name='avg_bf_per_outing')
-    df_players = df_players.merge(df_bf_per_app, how='left', left_on=['player_mlb_id', 'year'], right_on=['pitcher', 'year']).drop(columns='pitcher')
+def calculate_batters_faced_in_game(df_players, df_savant, df_games=None):
+    if df_games is None:
+        df_games = build_player_game_table(df_savant)
+    df_bf = df_games[df_games['batters_faced'] > 0].groupby(['player_mlb_id', 'year'])[['bf_sum', 'bf_count']].sum()
+    df_bf['avg_bf_per_outing'] = df_bf['bf_sum'] / df_bf['bf_count']
+    df_players = df_players.merge(df_bf['avg_bf_per_outing'].reset_index(), how='left', on=['player_mlb_id', 'year'])
     
     return df_players
 
@@ -95,19 +190,18 @@ def calculate_average_exp_ba(df_players,df_savant,player_type):
     return df_players
 
 #get the player's average lineup position on the year
-def calculate_lineup_position(df_players, df_savant):
-    # Find the first plate appearance of each batter per game
-    first_pa = df_savant.groupby(['game_pk', 'batter', 'year', 'inning_topbot'])['at_bat_number'].min().reset_index()
-    
-    # Assign lineup positions based on order of first at-bat, separately for top (away) and bottom (home) halves
-    first_pa['lineup_position'] = first_pa.groupby(['game_pk', 'year', 'inning_topbot'])['at_bat_number'].rank(method='first').astype(int)
-    
-    # Compute the average lineup position for each batter across the season
-    average_lineup_position = first_pa.groupby(['batter','year'])['lineup_position'].mean().reset_index()
-    average_lineup_position.rename(columns={'lineup_position': 'avg_lineup_position'}, inplace=True)
+def calculate_lineup_position(df_players, df_savant, df_games=None):
+    if df_games is None:
+        df_games = build_player_game_table(df_savant)
+
+    #average the per game lineup slots (order of first at-bat within the team's half) across the season
+    df_games = df_games[df_games['lineup_halves'] > 0]
+    slot_totals = (df_games['lineup_slot'] * df_games['lineup_halves']).groupby([df_games['player_mlb_id'], df_games['year']]).sum()
+    half_totals = df_games.groupby(['player_mlb_id', 'year'])['lineup_halves'].sum()
+    average_lineup_position = (slot_totals / half_totals).reset_index(name='avg_lineup_position')
 
     #merge with df_players
-    df_players = df_players.merge(average_lineup_position, left_on=['player_mlb_id', 'year'], right_on=['batter', 'year'], how='left').drop(columns='batter')
+    df_players = df_players.merge(average_lineup_position, on=['player_mlb_id', 'year'], how='left')
 
     return df_players
 
@@ -135,15 +229,98 @@ def get_count_for_play_event(df_player, df_sav, col_name, event, player_type):
 
     return df_player
 
+#list of all non NaN df_savant events
+PLAY_EVENTS = ['strikeout', 'caught_stealing_3b', 'field_out', 'walk',
+       'force_out', 'sac_fly', 'single', 'hit_by_pitch', 'double',
+       'grounded_into_double_play', 'sac_bunt', 'home_run',
+       'fielders_choice', 'field_error', 'other_out',
+       'caught_stealing_2b', 'triple', 'strikeout_double_play',
+       'fielders_choice_out', 'double_play', 'sac_fly_double_play',
+       'catcher_interf', 'pickoff_caught_stealing_2b', 'pickoff_2b',
+       'pickoff_caught_stealing_3b', 'triple_play', 'pickoff_1b',
+       'sac_bunt_double_play', 'wild_pitch', 'game_advisory',
+       'caught_stealing_home', 'pickoff_3b', 'stolen_base_2b',
+       'passed_ball', 'pickoff_caught_stealing_home', 'pickoff_error_3b',
+       'stolen_base_3b']
+
+#types of contact in the bb_type column
+CONTACT_TYPES = ['line_drive', 'fly_ball', 'ground_ball', 'popup']
+
+#count every category of one or more savant columns per player and year in a single grouped pass
+def count_play_events(df_savant, categories, player_types=('batter', 'pitcher')):
+    """
+    Builds the (player, year) x category count matrix for every requested role.
+
+    Each category column is factorized once against its vocabulary and the codes are
+    shared by all roles. Counts are then produced with a single np.bincount per role
+    and column, so the cost does not grow with the number of categories.
+
+    Parameters:
+    -----------
+    df_savant : pandas.DataFrame
+        Cleaned Baseball Savant pitch data with a 'year' column.
+    categories : dict
+        Maps a savant column (e.g. 'events', 'bb_type', 'type') to the list of values
+        to count. Use None to count every non-null value found in the column.
+    player_types : iterable of str
+        Savant id columns to group by, e.g. 'batter' and/or 'pitcher'.
+
+    Returns:
+    --------
+    pandas.DataFrame
+        One row per (player_mlb_id, year) that appears in df_savant for any role, with
+        integer columns named '<player_type>_<value>'. Players missing from a role get 0.
+    """
+    #factorize each category column once
+    category_codes = {}
+    for col_name, values in categories.items():
+        if values is None:
+            codes, values = pd.factorize(df_savant[col_name], sort=True)
+            values = list(values)
+        else:
+            codes = pd.Categorical(df_savant[col_name], categories=values).codes
+        category_codes[col_name] = (np.asarray(codes), values)
+
+    year_codes, years = pd.factorize(df_savant['year'])
+
+    role_counts = []
+    for player_type in player_types:
+        #compact id for every (player, year) pair of this role
+        player_codes, players = pd.factorize(df_savant[player_type])
+        valid = (player_codes >= 0) & (year_codes >= 0)
+        group_codes, group_keys = pd.factorize(player_codes[valid].astype(np.int64) * len(years) + year_codes[valid])
+        n_groups = len(group_keys)
+
+        index = pd.MultiIndex.from_arrays(
+            [np.asarray(players)[group_keys // len(years)], np.asarray(years)[group_keys % len(years)]],
+            names=['player_mlb_id', 'year']
+        )
+
+        #one bincount per category column gives the whole count matrix
+        blocks = []
+        for codes, values in category_codes.values():
+            codes = codes[valid]
+            matched = codes >= 0
+            flat = np.bincount(group_codes[matched] * len(values) + codes[matched], minlength=n_groups * len(values))
+            blocks.append(pd.DataFrame(flat.reshape(n_groups, len(values)), index=index,
+                                       columns=[f'{player_type}_{value}' for value in values]))
+
+        role_counts.append(pd.concat(blocks, axis=1))
+
+    #align the roles on (player, year); a player missing from a role had 0 of every event
+    df_counts = pd.concat(role_counts, axis=1).fillna(0).astype(int)
+
+    return df_counts
+
 #get columns for number of savant events occurrences for batters and pitchers
-def calculate_all_play_event_counts(df_players,df_savant):
+def calculate_all_play_event_counts(df_players,df_savant,df_counts=None):
     """
     Calculates the count of various baseball play events for each player, 
     both as a batter and as a pitcher, and adds these counts to the player DataFrame.
 
-    This function iterates over a predefined list of play events, computes the number 
-    of times each event occurred for every player per season, and appends these counts 
-    to df_players. Counts are calculated separately for when the player is batting and pitching.
+    All events and contact types are counted for both roles in one grouped pass 
+    (see count_play_events) and joined onto df_players with a single merge. 
+    Counts are calculated separately for when the player is batting and pitching.
 
     Parameters:
     -----------
@@ -151,6 +328,9 @@ def calculate_all_play_event_counts(df_players,df_savant):
         DataFrame containing player information, including player IDs and years.
     df_savant : pandas.DataFrame
         Baseball Savant dataset containing detailed event data for each play.
+    df_counts : pandas.DataFrame, optional
+        Precomputed count_play_events output for 'events' and 'bb_type' (e.g. from the 
+        streaming accumulators). df_savant is not used when it is given.
 
     Returns:
     --------
@@ -161,40 +341,64 @@ def calculate_all_play_event_counts(df_players,df_savant):
         - 'pitcher_<event>': Count of event occurrences when the player is pitching.
     """
     
-    #list of all non NaN df_savant events
-    play_events = ['strikeout', 'caught_stealing_3b', 'field_out', 'walk',
-           'force_out', 'sac_fly', 'single', 'hit_by_pitch', 'double',
-           'grounded_into_double_play', 'sac_bunt', 'home_run',
-           'fielders_choice', 'field_error', 'other_out',
-           'caught_stealing_2b', 'triple', 'strikeout_double_play',
-           'fielders_choice_out', 'double_play', 'sac_fly_double_play',
-           'catcher_interf', 'pickoff_caught_stealing_2b', 'pickoff_2b',
-           'pickoff_caught_stealing_3b', 'triple_play', 'pickoff_1b',
-           'sac_bunt_double_play', 'wild_pitch', 'game_advisory',
-           'caught_stealing_home', 'pickoff_3b', 'stolen_base_2b',
-           'passed_ball', 'pickoff_caught_stealing_home', 'pickoff_error_3b',
-           'stolen_base_3b']    
-    
-    #get the counts per season for every player
-    for event in play_events:
-        #calculate the count when player batting
-        df_players = get_count_for_play_event(df_players, df_savant, 'events', event, 'batter')
-        #calculate the count when player pitching
-        df_players = get_count_for_play_event(df_players, df_savant, 'events', event, 'pitcher')
-
-    #get the counts for hit ball types
-    types_of_contact = ['line_drive', 'fly_ball', 'ground_ball', 'popup']
-    
-    for contact in types_of_contact:
-        #calculate the count when player batting
-        df_players = get_count_for_play_event(df_players, df_savant, 'bb_type', contact, 'batter')
-        #calculate the count when player pitching
-        df_players = get_count_for_play_event(df_players, df_savant, 'bb_type', contact, 'pitcher') 
+    #get the counts per season for every player in both roles
+    if df_counts is None:
+        df_counts = count_play_events(df_savant, {'events': PLAY_EVENTS, 'bb_type': CONTACT_TYPES})
+
+    #keep the batter/pitcher column order of the per-event implementation
+    count_columns = [f'{player_type}_{event}' for event in PLAY_EVENTS + CONTACT_TYPES for player_type in ['batter', 'pitcher']]
+
+    #add all counts to the main dataframe at once
+    df_players = df_players.merge(df_counts[count_columns].reset_index(), on=['player_mlb_id', 'year'], how='left')
+    df_players[count_columns] = df_players[count_columns].fillna(0).astype(int)
     
     return df_players
 
+#time the single pass event counts against one get_count_for_play_event call per event and role
+def benchmark_play_event_counts(df_players, df_savant, repeat=3):
+    """
+    Compares calculate_all_play_event_counts with the per-event implementation it replaced.
+
+    The per-event version filters, groups and merges once for every event, contact type and
+    role. Both versions are run 'repeat' times, the outputs are checked to be identical and 
+    the best wall time of each is reported.
+
+    Returns:
+    --------
+    dict
+        Best times in seconds for 'per_event' and 'single_pass' and the resulting 'speedup'.
+    """
+    import time
+
+    def per_event_counts(df_players, df_savant):
+        for event in PLAY_EVENTS:
+            df_players = get_count_for_play_event(df_players, df_savant, 'events', event, 'batter')
+            df_players = get_count_for_play_event(df_players, df_savant, 'events', event, 'pitcher')
+        for contact in CONTACT_TYPES:
+            df_players = get_count_for_play_event(df_players, df_savant, 'bb_type', contact, 'batter')
+            df_players = get_count_for_play_event(df_players, df_savant, 'bb_type', contact, 'pitcher')
+        return df_players
+
+    timings = {}
+    outputs = {}
+    for name, func in [('per_event', per_event_counts), ('single_pass', calculate_all_play_event_counts)]:
+        best = np.inf
+        for _ in range(repeat):
+            start = time.perf_counter()
+            outputs[name] = func(df_players, df_savant)
+            best = min(best, time.perf_counter() - start)
+        timings[name] = best
+
+    #both implementations must give the same columns and values
+    pd.testing.assert_frame_equal(outputs['per_event'], outputs['single_pass'])
+
+    timings['speedup'] = timings['per_event'] / timings['single_pass']
+    print(f"per event: {timings['per_event']:.3f}s, single pass: {timings['single_pass']:.3f}s, speedup: {timings['speedup']:.1f}x")
+
+    return timings
+
 #generate basic batting stats
-def calculate_batting_stats(df_players, df_savant):
+def calculate_batting_stats(df_players, df_savant, type_counts=None):
     # Hits
     df_players['hits'] = df_players['batter_single'] + df_players['batter_double'] + df_players['batter_triple'] + df_players['batter_home_run']
     
@@ -221,8 +425,9 @@ def calculate_batting_stats(df_players, df_savant):
     df_players = hit_ball_type_rates(df_players, df_savant,'pitcher')
 
     #get ball/strike/inplay ratios
-    df_players = strike_ball_inplay_counts(df_players, df_savant, 'batter')
-    df_players = strike_ball_inplay_counts(df_players, df_savant, 'pitcher')
+    type_counts = type_counts or {}
+    df_players = strike_ball_inplay_counts(df_players, df_savant, 'batter', type_counts.get('batter'))
+    df_players = strike_ball_inplay_counts(df_players, df_savant, 'pitcher', type_counts.get('pitcher'))
     
     # Batting Average on Balls in Play (BABIP)
     df_players['babip_batter'] = (
@@ -343,12 +548,13 @@ def calculate_zone_chase_pct(df_players, df_savant):
 
     return df_players
 
+#pitch types counted as fastballs
+FASTBALLS = ['FF', 'FC', 'FT']
+
 #get average fastball velocity for pitchers
 def fastball_velocity(df_players, df_savant):
-    fastballs = ['FF', 'FC', 'FT']
-    
     # Filter for fastballs
-    df_savant_fb = df_savant[df_savant['pitch_type'].isin(fastballs)]    
+    df_savant_fb = df_savant[df_savant['pitch_type'].isin(FASTBALLS)]    
     
     # Compute average fastball velocity per pitcher per year
     avg_fb_vel = df_savant_fb.groupby(['pitcher', 'year'])['release_speed'].mean().reset_index()
@@ -361,15 +567,16 @@ def fastball_velocity(df_players, df_savant):
 
 #this code is likely not accurate, but closest I could get
 
+#events that record an out for the pitcher
+OUT_EVENTS = {"strikeout", "field_out", "force_out", "double_play", "triple_play", 
+              "grounded_into_double_play", "sac_bunt", "strikeout_double_play", 
+              "sac_bunt_double_play", "other_out"}
+
 #calculate ip/outs recorded
 def calculate_innings_pitched(df_players, df_savant):
     
-    out_events = {"strikeout", "field_out", "force_out", "double_play", "triple_play", 
-                  "grounded_into_double_play", "sac_bunt", "strikeout_double_play", 
-                  "sac_bunt_double_play", "other_out"}
-    
     # Vectorized calculation for outs recorded
-    df_savant['outs_recorded'] = df_savant['events'].isin(out_events).astype(int)
+    df_savant['outs_recorded'] = df_savant['events'].isin(OUT_EVENTS).astype(int)
 
     # Groupby pitcher and year
     pitcher_stats = df_savant.groupby(['pitcher', 'year'])['outs_recorded'].sum().reset_index()
@@ -392,17 +599,22 @@ def calculate_innings_pitched(df_players, df_savant):
 
 
 #find percentages of pitches that were strikes/balls/hit into play
-def strike_ball_inplay_counts(df_players, df_savant, player_type):
-    strike_counts = df_savant[df_savant['type'] == 'S'].groupby([player_type, 'year'])['type'].count().reset_index(name=f'{player_type}_strikes')
-    ball_counts = df_savant[df_savant['type'] == 'B'].groupby([player_type, 'year'])['type'].count().reset_index(name=f'{player_type}_balls')
-    inplay_counts = df_savant[df_savant['type'] == 'X'].groupby([player_type, 'year'])['type'].count().reset_index(name=f'{player_type}_inplay')
-    total_pitch_counts = df_savant.groupby([player_type, 'year'])['type'].count().reset_index(name=f'{player_type}_total_pitches')
+#type_counts can be passed instead of df_savant (count_play_events output on the 'type' column for this player_type)
+def strike_ball_inplay_counts(df_players, df_savant, player_type, type_counts=None):
+    #count every pitch type value in one grouped pass
+    if type_counts is None:
+        type_counts = count_play_events(df_savant, {'type': None}, player_types=[player_type])
+
+    df_type_counts = pd.DataFrame(index=type_counts.index)
+    for pitch_result, name in [('S', 'strikes'), ('B', 'balls'), ('X', 'inplay')]:
+        count_col = f'{player_type}_{pitch_result}'
+        counts = type_counts[count_col] if count_col in type_counts.columns else pd.Series(0, index=type_counts.index)
+        #a player with none of a result has no row for it, same as the filtered groupby
+        df_type_counts[f'{player_type}_{name}'] = counts.where(counts > 0)
+    df_type_counts[f'{player_type}_total_pitches'] = type_counts.sum(axis=1)
 
     #add counts to dataframe
-    df_players = df_players.merge(strike_counts, left_on=['player_mlb_id', 'year'], right_on=[player_type, 'year'], how='left').drop(columns=player_type)
-    df_players = df_players.merge(ball_counts, left_on=['player_mlb_id', 'year'], right_on=[player_type, 'year'], how='left').drop(columns=player_type)
-    df_players = df_players.merge(inplay_counts, left_on=['player_mlb_id', 'year'], right_on=[player_type, 'year'], how='left').drop(columns=player_type)
-    df_players = df_players.merge(total_pitch_counts, left_on=['player_mlb_id', 'year'], right_on=[player_type, 'year'], how='left').drop(columns=player_type)
+    df_players = df_players.merge(df_type_counts.reset_index(), on=['player_mlb_id', 'year'], how='left')
 
     #get ratios
     df_players[f'strike_ratio_{player_type}'] = df_players[f'{player_type}_strikes'] / df_players[f'{player_type}_total_pitches']
@@ -413,16 +625,12 @@ def strike_ball_inplay_counts(df_players, df_savant, player_type):
 
 # Get percentages for rates of different contact types
 def hit_ball_type_rates(df_players, df_savant, player_type):
-    ground_ball_counts = df_savant[df_savant['bb_type'] == 'ground_ball'].groupby([player_type,'year'])['type'].count().reset_index(name=f'{player_type}_ground_balls')
-    fly_ball_counts = df_savant[df_savant['bb_type'] == 'fly_ball'].groupby([player_type,'year'])['type'].count().reset_index(name=f'{player_type}_fly_balls')
-    line_drive_counts = df_savant[df_savant['bb_type'] == 'line_drive'].groupby([player_type,'year'])['type'].count().reset_index(name=f'{player_type}_line_drives')
-    popup_counts = df_savant[df_savant['bb_type'] == 'popup'].groupby([player_type,'year'])['type'].count().reset_index(name=f'{player_type}_popups')
-    
-    # Aggregate counts for each batted ball type
-    df_players = df_players.merge(ground_ball_counts, left_on=['player_mlb_id', 'year'], right_on=[player_type, 'year'], how='left').drop(columns=player_type)
-    df_players = df_players.merge(fly_ball_counts, left_on=['player_mlb_id', 'year'], right_on=[player_type, 'year'], how='left').drop(columns=player_type)
-    df_players = df_players.merge(line_drive_counts, left_on=['player_mlb_id', 'year'], right_on=[player_type, 'year'], how='left').drop(columns=player_type)
-    df_players = df_players.merge(popup_counts, left_on=['player_mlb_id', 'year'], right_on=[player_type, 'year'], how='left').drop(columns=player_type)
+    contact_names = {'ground_ball': 'ground_balls', 'fly_ball': 'fly_balls', 'line_drive': 'line_drives', 'popup': 'popups'}
+
+    # Reuse the contact counts from calculate_all_play_event_counts instead of counting again (no contact of a type stays NaN)
+    for contact, name in contact_names.items():
+        counts = df_players[f'{player_type}_{contact}']
+        df_players[f'{player_type}_{name}'] = counts.where(counts > 0)
 
     ball_types = ['fly_balls', 'ground_balls', 'line_drives', 'popups']
     # Compute ratios
@@ -451,34 +659,3117 @@ def calculate_woba(df_players, df_savant, player_type):
 def primary_position(df_players):
     field_counts = ['field_p', 'field_c', 'field_1b', 'field_2b', 'field_3b', 'field_ss', 'field_lf', 'field_cf', 'field_rf']
     df_field = df_players.groupby('player_mlb_id')[field_counts].sum().reset_index()
-    df_field['primary_position'] = df_field[field_counts].apply(lambda row: row.idxmax().replace('field_', '') if row.max() > 0 else 'Unknown', axis=1)
+
+    #most played position (first one on ties, like idxmax), Unknown for players who never took the field
+    counts = df_field[field_counts].to_numpy()
+    positions = np.array([col.replace('field_', '') for col in field_counts], dtype=object)
+    df_field['primary_position'] = np.where(counts.max(axis=1) > 0, positions[counts.argmax(axis=1)], 'Unknown')
     df_field = df_field[['player_mlb_id','primary_position']]
     
     df_players = df_players.merge(df_field, on = 'player_mlb_id', how = 'left')
 
     return df_players
 
-#clean the provided savant data
-def clean_savant_data(df_savant_raw):
+#calculate years since a player debuted
+def add_years_after_debut(df_players):
+    df_players['years_after_debut'] = df_players['year'] - df_players['debut'].str[-4:].astype(int)
+
+    return df_players
+
+#get player age and distance from the peak age window
+def add_age_columns(df_players):
+    #get player age
+    df_players['age'] = df_players['year'] - df_players['birthYear']
+    
+    #years from 26-28 peak age performance (https://tht.fangraphs.com/how-do-baseball-players-age-part-1/)
+    df_players['years_before_26'] = (26 - df_players['age']).clip(lower=0)
+    df_players['years_after_28'] = (df_players['age'] - 28).clip(lower=0)
+
+    return df_players
+
+#savant columns every feature needs to key rows by player, year and at bat
+BASE_SAVANT_COLUMNS = ['batter', 'pitcher', 'game_date', 'times_faced']
+
+#output columns of calculate_batting_stats (including the hit type and strike/ball helpers it calls)
+BATTING_STATS_OUTPUTS = (
+    ['hits', 'elig_pa', 'avg', 'tb', 'slg', 'obp', 'ops']
+    + [col for player_type in ['batter', 'pitcher'] for col in
+       [f'{player_type}_{name}' for name in ['ground_balls', 'fly_balls', 'line_drives', 'popups']]
+       + [f'{name}_ratio_{player_type}' for name in ['fly_balls', 'ground_balls', 'line_drives', 'popups']]
+       + [f'gb_fb_ratio_{player_type}', f'hr_fb_pct_{player_type}']]
+    + [col for player_type in ['batter', 'pitcher'] for col in
+       [f'{player_type}_strikes', f'{player_type}_balls', f'{player_type}_inplay', f'{player_type}_total_pitches',
+        f'strike_ratio_{player_type}', f'ball_ratio_{player_type}', f'inplay_ratio_{player_type}']]
+    + ['babip_batter', 'k_rate_batter', 'bb_rate_batter', 'hr_rate', 'stolen_bases', 'iso', 'xbh', 'rc',
+       'positions_played', 'k_bb_ratio_batter']
+)
+
+#every feature stage of add_to_df_players, in execution order
+#func: (df_players, df_savant, at_bat_ids[, df_games]) -> df_players
+#savant_columns: raw savant columns read by the stage (on top of BASE_SAVANT_COLUMNS)
+#player_columns: df_players (people) columns read by the stage
+#player_games: func takes the per player game table (build_player_game_table) as a fourth argument
+#depends: stages whose outputs must already be in df_players
+#per_year: the stage's values for a year only depend on that year's pitches and rows (can run on year shards)
+#outputs: columns the stage adds to df_players
+FEATURE_REGISTRY = {
+    'years_after_debut': {
+        'func': lambda df_players, df_savant, at_bat_ids: add_years_after_debut(df_players),
+        'savant_columns': [],
+        'player_columns': ['debut'],
+        'player_games': False,
+        'depends': [],
+        'per_year': True,
+        'outputs': ['years_after_debut'],
+    },
+    'pa_bf': {
+        'func': lambda df_players, df_savant, at_bat_ids: compute_player_pa_and_bf(df_players, at_bat_ids, df_savant),
+        'savant_columns': ['outs_when_up', 'events'],
+        'player_columns': [],
+        'player_games': False,
+        'depends': [],
+        'per_year': True,
+        'outputs': ['total_pa', 'total_bf', 'base_ended_inn'],
+    },
+    'fielding': {
+        'func': lambda df_players, df_savant, at_bat_ids, df_games=None: get_fielding_counts(df_players, df_savant, df_games),
+        'savant_columns': PLAYER_GAME_COLUMNS,
+        'player_columns': [],
+        'player_games': True,
+        'depends': [],
+        'per_year': True,
+        'outputs': ['field_' + position for position in FIELDING_DICT.values()],
+    },
+    'event_counts': {
+        'func': lambda df_players, df_savant, at_bat_ids: calculate_all_play_event_counts(df_players, df_savant),
+        'savant_columns': ['events', 'bb_type'],
+        'player_columns': [],
+        'player_games': False,
+        'depends': [],
+        'per_year': True,
+        'outputs': [f'{player_type}_{event}' for event in PLAY_EVENTS + CONTACT_TYPES for player_type in ['batter', 'pitcher']],
+    },
+    'lineup': {
+        'func': lambda df_players, df_savant, at_bat_ids, df_games=None: calculate_lineup_position(df_players, df_savant, df_games),
+        'savant_columns': PLAYER_GAME_COLUMNS,
+        'player_columns': [],
+        'player_games': True,
+        'depends': [],
+        'per_year': True,
+        'outputs': ['avg_lineup_position'],
+    },
+    'batting_stats': {
+        'func': lambda df_players, df_savant, at_bat_ids: calculate_batting_stats(df_players, df_savant),
+        'savant_columns': ['type'],
+        'player_columns': [],
+        'player_games': False,
+        'depends': ['pa_bf', 'fielding', 'event_counts'],
+        'per_year': True,
+        'outputs': BATTING_STATS_OUTPUTS,
+    },
+    'innings': {
+        'func': lambda df_players, df_savant, at_bat_ids: calculate_innings_pitched(df_players, df_savant),
+        'savant_columns': ['events'],
+        'player_columns': [],
+        'player_games': False,
+        'depends': [],
+        'per_year': True,
+        'outputs': ['outs_recorded', 'innings_pitched'],
+    },
+    'fastball': {
+        'func': lambda df_players, df_savant, at_bat_ids: fastball_velocity(df_players, df_savant),
+        'savant_columns': ['pitch_type', 'release_speed'],
+        'player_columns': [],
+        'player_games': False,
+        'depends': [],
+        'per_year': True,
+        'outputs': ['avg_fb_vel'],
+    },
+    'pitching_stats': {
+        'func': lambda df_players, df_savant, at_bat_ids: calculate_pitching_stats(df_players),
+        'savant_columns': [],
+        'player_columns': [],
+        'player_games': False,
+        'depends': ['pa_bf', 'event_counts', 'batting_stats', 'innings'],
+        'per_year': True,
+        'outputs': ['pitcher_hits_allowed', 'whip', 'k_rate_pitcher', 'bb_rate_pitcher', 'babip_pitcher',
+                    'hr_rate', 'baa', 'k_bb_ratio_pitcher'],
+    },
+    'bf_per_outing': {
+        'func': lambda df_players, df_savant, at_bat_ids, df_games=None: calculate_batters_faced_in_game(df_players, df_savant, df_games),
+        'savant_columns': PLAYER_GAME_COLUMNS,
+        'player_columns': [],
+        'player_games': True,
+        'depends': [],
+        'per_year': True,
+        'outputs': ['avg_bf_per_outing'],
+    },
+    'zone_chase': {
+        'func': lambda df_players, df_savant, at_bat_ids: calculate_zone_chase_pct(df_players, df_savant),
+        'savant_columns': ['zone', 'type'],
+        'player_columns': [],
+        'player_games': False,
+        'depends': [],
+        'per_year': True,
+        'outputs': ['zone_chase_pct'],
+    },
+    'rbis': {
+        'func': lambda df_players, df_savant, at_bat_ids: calculate_rbis(df_players, df_savant),
+        'savant_columns': ['post_bat_score', 'bat_score'],
+        'player_columns': [],
+        'player_games': False,
+        'depends': [],
+        'per_year': True,
+        'outputs': ['total_runs'],
+    },
+    'exp_ba': {
+        'func': lambda df_players, df_savant, at_bat_ids: calculate_average_exp_ba(
+            calculate_average_exp_ba(df_players, df_savant, 'batter'), df_savant, 'pitcher'),
+        'savant_columns': ['estimated_ba_using_speedangle'],
+        'player_columns': [],
+        'player_games': False,
+        'depends': [],
+        'per_year': True,
+        'outputs': ['batter_avg_exp_ba', 'pitcher_avg_exp_ba'],
+    },
+    'woba': {
+        'func': lambda df_players, df_savant, at_bat_ids: calculate_woba(
+            calculate_woba(df_players, df_savant, 'batter'), df_savant, 'pitcher'),
+        'savant_columns': ['woba_denom', 'woba_value'],
+        'player_columns': [],
+        'player_games': False,
+        'depends': [],
+        'per_year': True,
+        'outputs': ['batter_avg_woba', 'pitcher_avg_woba'],
+    },
+    'xwoba': {
+        'func': lambda df_players, df_savant, at_bat_ids: calculate_average_xwoba(
+            calculate_average_xwoba(df_players, df_savant, 'batter'), df_savant, 'pitcher'),
+        'savant_columns': ['estimated_woba_using_speedangle'],
+        'player_columns': [],
+        'player_games': False,
+        'depends': [],
+        'per_year': True,
+        'outputs': ['batter_avg_xwoba', 'pitcher_avg_xwoba'],
+    },
+    'primary_position': {
+        'func': lambda df_players, df_savant, at_bat_ids: primary_position(df_players),
+        'savant_columns': [],
+        'player_columns': [],
+        'player_games': False,
+        'depends': ['fielding'],
+        'per_year': False,
+        'outputs': ['primary_position'],
+    },
+    'sp_pct': {
+        'func': lambda df_players, df_savant, at_bat_ids, df_games=None: add_sp_percentage(df_players, df_savant, df_games),
+        'savant_columns': PLAYER_GAME_COLUMNS,
+        'player_columns': [],
+        'player_games': True,
+        'depends': [],
+        'per_year': False,
+        'outputs': ['sp_pct', 'starter', 'reliever', 'both_starter_reliever'],
+    },
+    'age': {
+        'func': lambda df_players, df_savant, at_bat_ids: add_age_columns(df_players),
+        'savant_columns': [],
+        'player_columns': ['birthYear'],
+        'player_games': False,
+        'depends': [],
+        'per_year': True,
+        'outputs': ['age', 'years_before_26', 'years_after_28'],
+    },
+}
+
+#features used by the batting and pitching models (2.Batter_Features / 2.Pitcher_Features)
+BATTER_MODEL_FEATURES = ['player_mlb_id', 'year', 'age', 'years_after_28', 'bats', 'primary_position', 'ops',
+                         'k_rate_batter', 'bb_rate_batter', 'batter_avg_exp_ba', 'babip_batter',
+                         'fly_balls_ratio_batter', 'ground_balls_ratio_batter', 'line_drives_ratio_batter',
+                         'popups_ratio_batter', 'hr_fb_pct_batter', 'avg_lineup_position', 'batter_avg_xwoba',
+                         'batter_avg_woba', 'total_pa']
+PITCHER_MODEL_FEATURES = ['player_mlb_id', 'age', 'year', 'primary_position', 'years_after_28', 'throws', 'whip',
+                          'baa', 'sp_pct', 'k_rate_pitcher', 'pitcher_avg_xwoba', 'pitcher_avg_woba',
+                          'bb_rate_pitcher', 'inplay_ratio_pitcher', 'pitcher_avg_exp_ba', 'babip_pitcher',
+                          'fly_balls_ratio_pitcher', 'ground_balls_ratio_pitcher', 'line_drives_ratio_pitcher',
+                          'popups_ratio_pitcher', 'hr_fb_pct_pitcher', 'avg_bf_per_outing', 'zone_chase_pct',
+                          'avg_fb_vel', 'starter', 'reliever', 'both_starter_reliever', 'total_bf']
+
+#find the stages needed for the requested output columns, in execution order
+def resolve_feature_stages(outputs=None, df_players_columns=()):
+    """
+    Resolves the dependency graph of FEATURE_REGISTRY for a list of output columns.
+
+    Parameters:
+    -----------
+    outputs : list of str, optional
+        Columns wanted in df_players. All stages are returned if None.
+    df_players_columns : iterable of str
+        Columns already in df_players (e.g. 'bats', 'throws'); requesting them needs no stage.
+
+    Returns:
+    --------
+    list of str
+        Stage names in registry order, which is a valid execution order.
+    """
+    if outputs is None:
+        return list(FEATURE_REGISTRY)
+
+    #map every output to the last stage writing it (pitching_stats overwrites hr_rate)
+    producers = {}
+    for name, stage in FEATURE_REGISTRY.items():
+        for col in stage['outputs']:
+            producers[col] = name
+
+    needed = set()
+    def require(name):
+        if name not in needed:
+            needed.add(name)
+            for upstream in FEATURE_REGISTRY[name]['depends']:
+                require(upstream)
+
+    for col in outputs:
+        if col in producers:
+            require(producers[col])
+        elif col not in df_players_columns and col != 'year':
+            raise ValueError(f'no feature stage produces {col!r}')
+
+    return [name for name in FEATURE_REGISTRY if name in needed]
+
+#savant columns that have to be read for a set of stages
+def savant_columns_for_stages(stages):
+    columns = list(BASE_SAVANT_COLUMNS)
+    for name in stages:
+        columns += [col for col in FEATURE_REGISTRY[name]['savant_columns'] if col not in columns]
+
+    return columns
+
+#switch and records of the per-stage pipeline instrumentation (off by default)
+PIPELINE_PROFILE = {'enabled': False, 'trace_memory': False, 'records': []}
+
+#turn the per-stage instrumentation on or off; turning it on clears earlier records
+def enable_pipeline_profiling(enabled=True, trace_memory=False):
+    """
+    Switches the instrumentation of the feature stages run by add_to_df_players, 
+    assemble_df_players and build_split_features.
+
+    Every stage then records its wall time, CPU time, the growth of the process peak RSS, 
+    the input and output row counts and the width of df_players after it. With trace_memory 
+    the peak Python allocation of each stage is also traced with tracemalloc, which slows the 
+    stages down noticeably, so it is off unless asked for. When profiling is off a stage costs 
+    one dict lookup more than calling it directly.
+
+    Of add_to_df_players_parallel only the stages run in the parent process are recorded.
+    """
+    import tracemalloc
+
+    if PIPELINE_PROFILE['trace_memory'] and tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+    PIPELINE_PROFILE.update({'enabled': enabled, 'trace_memory': enabled and trace_memory, 'records': []})
+
+    if PIPELINE_PROFILE['trace_memory']:
+        tracemalloc.start()
+
+#peak resident set size of the process in MB (None where the resource module is missing, e.g. Windows)
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return None
+
+    import sys
+    #ru_maxrss is in bytes on macOS and in kilobytes on Linux
+    scale = 2**20 if sys.platform == 'darwin' else 2**10
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+
+#run one feature stage, recording its cost when profiling is on
+def run_profiled_stage(name, func, df_players, df_savant, at_bat_ids, df_games=None):
+    #stages flagged player_games get the prebuilt per player game table (they build their own without it)
+    args = (df_players, df_savant, at_bat_ids)
+    if df_games is not None and name in FEATURE_REGISTRY and FEATURE_REGISTRY[name]['player_games']:
+        args += (df_games,)
+
+    if not PIPELINE_PROFILE['enabled']:
+        return func(*args)
+
+    import time
+    import tracemalloc
+
+    tracing = PIPELINE_PROFILE['trace_memory'] and tracemalloc.is_tracing()
+    if tracing:
+        tracemalloc.reset_peak()
+        start_traced, _ = tracemalloc.get_traced_memory()
+    start_rss = peak_rss_mb()
+    start_wall = time.perf_counter()
+    start_cpu = time.process_time()
+
+    df_result = func(*args)
+
+    record = {
+        'stage': name,
+        'wall_seconds': time.perf_counter() - start_wall,
+        'cpu_seconds': time.process_time() - start_cpu,
+        'peak_rss_mb': peak_rss_mb(),
+        'peak_rss_growth_mb': None if start_rss is None else peak_rss_mb() - start_rss,
+        'peak_alloc_mb': None,
+        'rows_in': len(df_players),
+        'rows_out': len(df_result),
+        'savant_rows': None if df_savant is None else len(df_savant),
+        'columns_out': df_result.shape[1],
+    }
+    if tracing:
+        _, peak = tracemalloc.get_traced_memory()
+        record['peak_alloc_mb'] = (peak - start_traced) / 2**20
+    PIPELINE_PROFILE['records'].append(record)
+
+    return df_result
+
+#per player game table shared by the stages that need it, built once (None when no stage does)
+def player_game_table_for_stages(stages, df_savant):
+    if not any(FEATURE_REGISTRY[name]['player_games'] for name in stages):
+        return None
+
+    return run_profiled_stage('player_game_table', lambda df_players, df_savant, at_bat_ids: build_player_game_table(df_savant),
+                              df_savant, df_savant, None)
+
+#table, readable summary and json file of the recorded stages
+def pipeline_profile_report(path=None, verbose=True):
+    """
+    Reports the stages recorded since enable_pipeline_profiling was called.
+
+    Parameters:
+    -----------
+    path : str, optional
+        Json file the records are written to, together with their totals.
+    verbose : bool
+        Print a summary with the stages sorted by wall time and their share of the total.
+
+    Returns:
+    --------
+    pandas.DataFrame
+        One row per recorded stage, in execution order.
+    """
+    import json
+
+    df_report = pd.DataFrame(PIPELINE_PROFILE['records'], columns=['stage', 'wall_seconds', 'cpu_seconds', 'peak_rss_mb',
+                                                                    'peak_rss_growth_mb', 'peak_alloc_mb', 'rows_in',
+                                                                    'rows_out', 'savant_rows', 'columns_out'])
+
+    if path is not None:
+        with open(path, 'w') as f:
+            json.dump({
+                'total_wall_seconds': float(df_report['wall_seconds'].sum()),
+                'total_cpu_seconds': float(df_report['cpu_seconds'].sum()),
+                'stages': PIPELINE_PROFILE['records'],
+            }, f, indent=1)
+
+    if verbose and len(df_report):
+        df_summary = df_report.sort_values('wall_seconds', ascending=False)
+        df_summary.insert(2, 'wall_pct', 100 * df_summary['wall_seconds'] / df_summary['wall_seconds'].sum())
+        print(df_summary.dropna(axis=1, how='all').round(3).to_string(index=False))
+        print(f"total: {df_report['wall_seconds'].sum():.3f}s wall, {df_report['cpu_seconds'].sum():.3f}s cpu, "
+              f"{len(df_report)} stages")
+
+    return df_report
+
+#main function dictating which functions to call for calculating player stats
+def add_to_df_players(df_players, df_savant, at_bat_ids, outputs=None):
+    """
+    Enhances the df_players DataFrame by computing and adding various performance statistics 
+    based on player event data from df_savant and at_bat_ids.
+
+    This function:
+    - Filters out players without an MLB ID.
+    - Computes the number of years since a player’s MLB debut.
+    - Aggregates plate appearance (PA) and batters faced (BF) counts.
+    - Tracks fielding appearances at different positions.
+    - Counts the occurrences of various play events (e.g., hits, strikeouts, walks).
+    - Computes key batting statistics like batting average, slugging, and on-base percentage.
+
+    The stages and their order come from FEATURE_REGISTRY. When outputs is given only the 
+    stages needed for those columns (and their upstream stages) are run.
+
+    Parameters:
+    -----------
+    df_players : pandas.DataFrame
+        DataFrame containing player-level information, including player IDs and debut years.
+    df_savant : pandas.DataFrame
+        Baseball Savant event-level data, which includes play-by-play information.
+    at_bat_ids : pandas.DataFrame
+        At bat lookup table returned by clean_savant_data.
+    outputs : list of str, optional
+        Columns wanted in the result. Every feature is computed if None.
+
+    Returns:
+    --------
+    pandas.DataFrame
+        Updated df_players with additional columns
+    """
+    
+    #remove players without an mlb Id
+    df_players = df_players[df_players['player_mlb_id'].notna()]
+
+    stages = resolve_feature_stages(outputs, df_players.columns)
+    df_games = player_game_table_for_stages(stages, df_savant)
+
+    for name in stages:
+        df_players = run_profiled_stage(name, FEATURE_REGISTRY[name]['func'], df_players, df_savant, at_bat_ids, df_games)
+
+    return df_players
+
+#read only the savant columns the requested features need and build df_players
+def build_df_players(df_players, source_paths, outputs=None):
+    """
+    Loads the savant csv(s) with a column projection and runs the stages for outputs.
+
+    Parameters:
+    -----------
+    df_players : pandas.DataFrame
+        Player season frame (people x years).
+    source_paths : str or list of str
+        Savant csv file(s).
+    outputs : list of str, optional
+        Columns wanted, e.g. BATTER_MODEL_FEATURES. Every feature is computed if None.
+
+    Returns:
+    --------
+    pandas.DataFrame
+        df_players with the requested features (and the intermediate columns they need).
+    """
+    if isinstance(source_paths, str):
+        source_paths = [source_paths]
+
+    stages = resolve_feature_stages(outputs, df_players.columns)
+    usecols = set(savant_columns_for_stages(stages))
+
+    df_savant_raw = read_savant_csv(source_paths, usecols=usecols)
+    df_savant, at_bat_ids = clean_savant_data(df_savant_raw)
+
+    return add_to_df_players(df_players, df_savant, at_bat_ids, outputs)
+
+#(player, year) pairs that appear in the savant data as batter, pitcher or fielder
+def active_player_years(df_savant):
+    roles = [col for col in ['batter', 'pitcher'] + FIELDING_COLUMNS if col in df_savant.columns]
+    df_keys = pd.concat([df_savant[[col, 'year']].drop_duplicates().set_axis(['player_mlb_id', 'year'], axis=1) for col in roles])
+
+    return df_keys.dropna().drop_duplicates()
+
+#build df_players from stage outputs aligned on the active player seasons, concatenated once
+def assemble_df_players(df_players, df_savant, at_bat_ids, outputs=None):
+    """
+    Sparse version of add_to_df_players.
+
+    Only the (player, year) rows of df_players that appear in the savant data are kept. Each 
+    stage runs on a narrow frame holding the keys, the people columns it reads and the outputs 
+    of its upstream stages, so its merges no longer copy the whole wide frame. The stage 
+    outputs, aligned on the active rows, are concatenated with the people attributes once at 
+    the end.
+
+    Parameters:
+    -----------
+    df_players : pandas.DataFrame
+        Player season frame (people x years).
+    df_savant : pandas.DataFrame
+        Cleaned Baseball Savant pitch data.
+    at_bat_ids : pandas.DataFrame
+        At bat lookup table returned by clean_savant_data.
+    outputs : list of str, optional
+        Columns wanted in the result. Every feature is computed if None.
+
+    Returns:
+    --------
+    pandas.DataFrame
+        The active rows of df_players with the same columns, in the same order and with the 
+        same values as add_to_df_players.
+    """
+    #people attributes only for the player seasons in the savant data
+    df_active = df_players[df_players['player_mlb_id'].notna()].merge(active_player_years(df_savant), on=['player_mlb_id', 'year'])
+    df_keys = df_active[['player_mlb_id', 'year']]
+
+    stages = resolve_feature_stages(outputs, df_players.columns)
+    df_games = player_game_table_for_stages(stages, df_savant)
+
+    stage_outputs = {}
+    for name in stages:
+        stage = FEATURE_REGISTRY[name]
+        df_input = pd.concat([df_keys, df_active[stage['player_columns']]]
+                             + [stage_outputs[upstream] for upstream in stage['depends']], axis=1)
+        df_result = run_profiled_stage(name, stage['func'], df_input, df_savant, at_bat_ids, df_games)
+        stage_outputs[name] = stage_output_columns(name, df_input, df_result)
+
+    #a column written by several stages (hr_rate) keeps its first position and its last value
+    feature_columns = {}
+    for df_output in stage_outputs.values():
+        for col in df_output.columns:
+            feature_columns[col] = df_output[col]
+
+    return pd.concat([df_active, pd.DataFrame(feature_columns, index=df_active.index)], axis=1)
+
+#split dimensions that are derived from other savant columns
+SPLIT_DERIVED_COLUMNS = {
+    'month': lambda df_savant: df_savant['game_date'].dt.month,
+}
+
+#stages that need the real season in the year column, or that are not computed per season
+SPLIT_EXCLUDED_STAGES = ['years_after_debut', 'primary_position', 'sp_pct', 'age']
+
+#compute the per season features for every combination of split values in one run of the stages
+def build_split_features(df_players, df_savant, at_bat_ids, splits, outputs=None):
+    """
+    Computes the savant features per (player, year, split) for platoon, home/away, monthly 
+    or any other split of the pitch data.
+
+    Every feature function groups by ('player_mlb_id', 'year'), so the year column of the 
+    savant data is replaced by an id for each (year, split values) combination and the stages 
+    run once over all groups. The cost grows with the number of groups, not with the number 
+    of splits. At bat level counts (total_pa, total_bf) use the split values of the first 
+    pitch of the at bat.
+
+    Parameters:
+    -----------
+    df_players : pandas.DataFrame
+        Player season frame (people x years).
+    df_savant : pandas.DataFrame
+        Cleaned Baseball Savant pitch data.
+    at_bat_ids : pandas.DataFrame
+        At bat lookup table returned by clean_savant_data.
+    splits : list of str
+        Split dimensions: savant columns (e.g. 'p_throws', 'stand', 'inning_topbot') or 
+        keys of SPLIT_DERIVED_COLUMNS (e.g. 'month').
+    outputs : list of str, optional
+        Columns wanted. Every feature except those of SPLIT_EXCLUDED_STAGES is computed if None.
+
+    Returns:
+    --------
+    pandas.DataFrame
+        Long table with one row per player, year and split combination the player appeared 
+        in as batter or pitcher. It has the df_players columns, a 'split' label 
+        (e.g. 'p_throws=L|month=5'), one column per split dimension and the features.
+    """
+    stages = resolve_feature_stages(outputs, df_players.columns)
+    excluded = [name for name in stages if name in SPLIT_EXCLUDED_STAGES]
+    if outputs is None:
+        stages = [name for name in stages if name not in SPLIT_EXCLUDED_STAGES]
+    elif excluded:
+        raise ValueError(f'stages {excluded} cannot be computed per split')
+
+    #number every (year, split values) combination
+    split_values = pd.DataFrame({
+        dim: SPLIT_DERIVED_COLUMNS[dim](df_savant) if dim in SPLIT_DERIVED_COLUMNS else df_savant[dim]
+        for dim in splits
+    })
+    split_values.insert(0, 'year', df_savant['year'])
+    split_ids = factorize_key_columns(split_values, ['year'] + list(splits))
+
+    #one row per split id with its year, values and label
+    _, first_rows = np.unique(split_ids, return_index=True)
+    df_splits = split_values.iloc[first_rows].reset_index(drop=True)
+    df_splits.insert(0, 'split_id', split_ids[first_rows])
+    df_splits.insert(2, 'split', ['|'.join(f'{dim}={value}' for dim, value in zip(splits, values)) or 'all'
+                                  for values in df_splits[list(splits)].to_numpy().tolist()])
+
+    #savant data and at bats with the split id as their year
+    df_split_savant = df_savant.copy(deep=False)
+    df_split_savant['year'] = split_ids
+    _, first_pitches = np.unique(df_savant['at_bat_id'].to_numpy(), return_index=True)
+    at_bat_split_ids = pd.Series(split_ids[first_pitches], index=df_savant['at_bat_id'].to_numpy()[first_pitches])
+    split_at_bat_ids = at_bat_ids.copy(deep=False)
+    split_at_bat_ids['year'] = at_bat_split_ids.reindex(at_bat_ids['at_bat_id']).to_numpy()
+
+    #a row for every player in every split group the player batted or pitched in
+    df_active = pd.concat([
+        pd.DataFrame({'player_mlb_id': df_split_savant[player_type].to_numpy(), 'split_id': split_ids})
+        for player_type in ['batter', 'pitcher']
+    ]).drop_duplicates()
+    df_active = df_active.merge(df_splits[['split_id', 'year']], on='split_id')
+    df_split_players = df_players[df_players['player_mlb_id'].notna()].merge(df_active, on=['player_mlb_id', 'year'])
+    df_split_players = df_split_players.drop(columns='year').rename(columns={'split_id': 'year'})
+
+    df_split_games = player_game_table_for_stages(stages, df_split_savant)
+    for name in stages:
+        df_split_players = run_profiled_stage(name, FEATURE_REGISTRY[name]['func'], df_split_players, df_split_savant,
+                                              split_at_bat_ids, df_split_games)
+
+    #swap the split ids back for the real year and the split values
+    feature_columns = [col for col in df_split_players.columns if col not in df_players.columns]
+    df_split_players = df_split_players.rename(columns={'year': 'split_id'}).merge(df_splits, on='split_id', how='left')
+
+    return df_split_players[list(df_players.columns) + ['split'] + list(splits) + feature_columns]
+
+#savant data shared with the forked workers of add_to_df_players_parallel (set before the pool starts)
+PARALLEL_SHARED = {}
+
+#row range of every year in a frame whose rows are grouped by year
+def year_bounds(df):
+    years = df['year'].to_numpy()
+    change = np.flatnonzero(years[1:] != years[:-1]) + 1
+    starts = np.concatenate([[0], change])
+    stops = np.concatenate([change, [len(years)]])
+
+    return {years[start]: (start, stop) for start, stop in zip(starts, stops)}
+
+#stable sort by year unless the rows are already grouped by year
+def group_rows_by_year(df):
+    years = df['year'].to_numpy()
+    if len(years) and np.count_nonzero(years[1:] != years[:-1]) + 1 != len(np.unique(years)):
+        df = df.iloc[np.argsort(years, kind='stable')]
+
+    return df
+
+#columns a stage added to (or overwrote in) df_players, indexed like the input rows
+def stage_output_columns(name, df_input, df_result):
+    if len(df_result) != len(df_input):
+        raise ValueError(f'feature stage {name!r} changed the number of df_players rows')
+
+    columns = [col for col in df_result.columns
+               if col not in df_input.columns or col in FEATURE_REGISTRY[name]['outputs']]
+    df_output = df_result[columns]
+    df_output.index = df_input.index
+
+    return df_output
+
+#run one stage, optionally on one year of the shared data, in a worker
+def run_feature_stage_shard(name, year, df_input=None):
+    df_savant = PARALLEL_SHARED['df_savant']
+    at_bat_ids = PARALLEL_SHARED['at_bat_ids']
+    df_games = PARALLEL_SHARED['df_games']
+    if df_input is None:
+        df_input = PARALLEL_SHARED['df_players']
+
+    if year is not None:
+        #the rows are grouped by year, so these slices are views of the shared columns
+        start, stop = PARALLEL_SHARED['savant_bounds'].get(year, (0, 0))
+        df_savant = df_savant.iloc[start:stop]
+        start, stop = PARALLEL_SHARED['at_bat_bounds'].get(year, (0, 0))
+        at_bat_ids = at_bat_ids.iloc[start:stop]
+        if df_games is not None:
+            start, stop = PARALLEL_SHARED['games_bounds'].get(year, (0, 0))
+            df_games = df_games.iloc[start:stop]
+        df_input = df_input[df_input['year'] == year]
+
+    args = (df_input, df_savant, at_bat_ids)
+    if df_games is not None and FEATURE_REGISTRY[name]['player_games']:
+        args += (df_games,)
+    df_result = FEATURE_REGISTRY[name]['func'](*args)
+
+    return stage_output_columns(name, df_input, df_result)
+
+#add computed stage columns to df_players in registry order, running the df_players only stages inline
+def apply_stage_outputs(df_players, stages, stage_outputs):
+    for name in FEATURE_REGISTRY:
+        if name not in stages:
+            continue
+        if name in stage_outputs:
+            for col in stage_outputs[name].columns:
+                df_players[col] = stage_outputs[name][col]
+        else:
+            df_players = run_profiled_stage(name, FEATURE_REGISTRY[name]['func'], df_players, None, None)
+
+    return df_players
+
+#parallel version of add_to_df_players
+def add_to_df_players_parallel(df_players, df_savant, at_bat_ids, outputs=None, n_jobs=None, shard_by_year=True):
+    """
+    Runs the savant stages of add_to_df_players on a pool of worker processes.
+
+    Independent stages run at the same time, and every stage flagged per_year in 
+    FEATURE_REGISTRY is also split into one task per season. Stages that depend on other 
+    savant stages (batting_stats) run in a later wave. Stages that only use df_players 
+    columns (pitching stats, primary position, age) run in the parent while the results 
+    are stitched back in registry order, so the output is identical to add_to_df_players 
+    whatever order the tasks finish in.
+
+    The per player game table (build_player_game_table) is built once in the parent and 
+    every shard of the stages flagged player_games gets its year's rows of it. The workers 
+    are forked once, after the pitch data and that table are placed in PARALLEL_SHARED, so 
+    they read the parent's columns through copy-on-write memory instead of receiving a 
+    pickled copy, and the same pool runs every wave. Storing strings as categoricals (see 
+    load_clean_savant_data) keeps those pages shared. Without fork (e.g. Windows) or with 
+    n_jobs=1 the stages run unsharded in this process.
+
+    Parameters:
+    -----------
+    df_players, df_savant, at_bat_ids, outputs :
+        Same as add_to_df_players.
+    n_jobs : int, optional
+        Number of worker processes. Defaults to the number of cores.
+    shard_by_year : bool
+        Split per_year stages into one task per season (only when running on a pool).
+
+    Returns:
+    --------
+    pandas.DataFrame
+        Same result as add_to_df_players.
+    """
+    import multiprocessing
+    import os
+
+    #remove players without an mlb Id
+    df_players = df_players[df_players['player_mlb_id'].notna()].reset_index(drop=True)
+
+    stages = resolve_feature_stages(outputs, df_players.columns)
+    savant_stages = [name for name in stages if FEATURE_REGISTRY[name]['savant_columns']]
+
+    #wave of a stage: savant stages it depends on (directly or through df_players only stages) must finish first
+    waves = {}
+    def stage_wave(name):
+        if name not in waves:
+            upstream = [stage_wave(dep) + (dep in savant_stages) for dep in FEATURE_REGISTRY[name]['depends']]
+            waves[name] = max(upstream, default=0)
+        return waves[name]
+
+    def ancestors(name):
+        found = set()
+        for dep in FEATURE_REGISTRY[name]['depends']:
+            found |= {dep} | ancestors(dep)
+        return found
+
+    n_jobs = n_jobs or os.cpu_count()
+    use_pool = n_jobs > 1 and 'fork' in multiprocessing.get_all_start_methods()
+
+    #season shards only pay off when there are workers to run them side by side
+    shard_by_year = shard_by_year and use_pool
+
+    df_games = player_game_table_for_stages(savant_stages, df_savant)
+    if shard_by_year:
+        df_savant = group_rows_by_year(df_savant)
+        at_bat_ids = group_rows_by_year(at_bat_ids)
+        if df_games is not None:
+            df_games = group_rows_by_year(df_games)
+    years = sorted(df_players['year'].unique())
+
+    PARALLEL_SHARED.update({
+        'df_players': df_players,
+        'df_savant': df_savant,
+        'at_bat_ids': at_bat_ids,
+        'df_games': df_games,
+        'savant_bounds': year_bounds(df_savant) if shard_by_year else {},
+        'at_bat_bounds': year_bounds(at_bat_ids) if shard_by_year else {},
+        'games_bounds': year_bounds(df_games) if shard_by_year and df_games is not None else {},
+    })
+
+    #one pool for all waves, no larger than the biggest wave
+    wave_sizes = {}
+    for name in savant_stages:
+        shard_count = len(years) if shard_by_year and FEATURE_REGISTRY[name]['per_year'] else 1
+        wave_sizes[stage_wave(name)] = wave_sizes.get(stage_wave(name), 0) + shard_count
+    n_jobs = min(n_jobs, max(wave_sizes.values(), default=1))
+
+    stage_outputs = {}
+    pool = multiprocessing.get_context('fork').Pool(n_jobs) if use_pool else None
+    try:
+        for wave in sorted(wave_sizes):
+            tasks = []
+            for name in [name for name in savant_stages if stage_wave(name) == wave]:
+                #stages with upstream dependencies get df_players with those columns filled in
+                df_input = None
+                if FEATURE_REGISTRY[name]['depends']:
+                    df_input = apply_stage_outputs(df_players.copy(), ancestors(name), stage_outputs)
+                shards = years if shard_by_year and FEATURE_REGISTRY[name]['per_year'] else [None]
+                tasks += [(name, year, df_input) for year in shards]
+
+            if use_pool:
+                results = pool.starmap(run_feature_stage_shard, tasks)
+            else:
+                results = [run_feature_stage_shard(*task) for task in tasks]
+
+            #stitch the shards of every stage back into row order
+            shard_results = {}
+            for (name, year, _), df_output in zip(tasks, results):
+                shard_results.setdefault(name, []).append(df_output)
+            for name, parts in shard_results.items():
+                stage_outputs[name] = pd.concat(parts).sort_index()
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+        PARALLEL_SHARED.clear()
+
+    return apply_stage_outputs(df_players, stages, stage_outputs)
+
+#columns that identify a single at bat
+AT_BAT_KEY_COLUMNS = ['batter','pitcher','game_date','year','times_faced']
+
+#add the derived columns every savant row needs (also used on chunks when streaming)
+def add_savant_columns(df_savant_raw):
     #convert game date to datetime column
     df_savant_raw['game_date'] = pd.to_datetime(df_savant_raw['game_date'])
     
     #create column for year
     df_savant_raw['year'] = df_savant_raw['game_date'].dt.year
     
-    #create column for runs scored on a play
-    df_savant_raw['runs_on_play'] = df_savant_raw['post_bat_score'] - df_savant_raw['bat_score']
+    #create column for runs scored on a play (the score and movement columns may be left out by a column projection)
+    if {'post_bat_score', 'bat_score'}.issubset(df_savant_raw.columns):
+        df_savant_raw['runs_on_play'] = df_savant_raw['post_bat_score'] - df_savant_raw['bat_score']
     
     #find pythagorean distance of run
-    df_savant_raw['dist_pitch_run'] = (df_savant_raw['pfx_x']**2 + df_savant_raw['pfx_z']**2)**.5
+    if {'pfx_x', 'pfx_z'}.issubset(df_savant_raw.columns):
+        df_savant_raw['dist_pitch_run'] = (df_savant_raw['pfx_x']**2 + df_savant_raw['pfx_z']**2)**.5
+
+    return df_savant_raw
+
+#number rows by their combination of key columns, in order of first appearance, without a join
+def factorize_key_columns(df, key_columns):
+    #compact integer codes per column, combined pairwise and re-factorized so they never overflow
+    group_codes = np.zeros(len(df), dtype=np.int64)
+    for col in key_columns:
+        col_codes, col_uniques = pd.factorize(df[col], use_na_sentinel=False)
+        group_codes, _ = pd.factorize(group_codes * (len(col_uniques) + 1) + col_codes)
+
+    return group_codes
+
+#clean the provided savant data
+def clean_savant_data(df_savant_raw, at_bat_key='factorize'):
+    """
+    Adds the derived columns to the raw savant data and assigns an at_bat_id to every pitch.
+
+    Parameters:
+    -----------
+    df_savant_raw : pandas.DataFrame
+        Raw Baseball Savant pitch data. Modified in place unless at_bat_key is 'merge'.
+    at_bat_key : str
+        How at bats are identified:
+        - 'factorize': groups of AT_BAT_KEY_COLUMNS numbered in order of first appearance 
+          directly on the pitch table. Gives the same ids as 'merge' without the join.
+        - 'merge': drop_duplicates on AT_BAT_KEY_COLUMNS and inner merge back onto the 
+          pitches (the original implementation, kept for check_at_bat_keying).
+        - 'game': natural key game_pk * 1000 + at_bat_number, stable across reruns and 
+          data updates. It partitions the pitches differently from the other modes in two 
+          cases: it separates the games of a doubleheader, which share the date, and it keeps 
+          an at bat with a pitching change during the plate appearance under one key, where 
+          the other modes split it by pitcher.
+
+    Returns:
+    --------
+    tuple of pandas.DataFrame
+        (df_savant, at_bat_ids) where at_bat_ids has one row per at bat with its key columns.
+    """
+    #add the date, year and run columns
+    df_savant_raw = add_savant_columns(df_savant_raw)
+
+    if at_bat_key == 'merge':
+        #create dataframe for each at bat
+        at_bat_ids = df_savant_raw[AT_BAT_KEY_COLUMNS].drop_duplicates()
+        
+        #assign a unique id to each at bat
+        at_bat_ids['at_bat_id'] = range(1, len(at_bat_ids) + 1)
+        
+        #add unique ids to original savant data
+        df_savant = df_savant_raw.merge(at_bat_ids, on=AT_BAT_KEY_COLUMNS,how='inner')
+
+        return df_savant, at_bat_ids
+
+    if at_bat_key == 'factorize':
+        key_columns = AT_BAT_KEY_COLUMNS
+        df_savant_raw['at_bat_id'] = factorize_key_columns(df_savant_raw, key_columns) + 1
+    elif at_bat_key == 'game':
+        key_columns = AT_BAT_KEY_COLUMNS + ['game_pk', 'at_bat_number']
+        df_savant_raw['at_bat_id'] = df_savant_raw['game_pk'].astype(np.int64) * 1000 + df_savant_raw['at_bat_number']
+    else:
+        raise ValueError(f"at_bat_key must be 'factorize', 'merge' or 'game', got {at_bat_key!r}")
+
+    #lookup table with the first pitch of every at bat
+    _, first_rows = np.unique(df_savant_raw['at_bat_id'].to_numpy(), return_index=True)
+    at_bat_ids = df_savant_raw[key_columns + ['at_bat_id']].iloc[np.sort(first_rows)].reset_index(drop=True)
+
+    return df_savant_raw, at_bat_ids
+
+#check that a keying mode splits the pitches into the same at bats as the merge based keying
+def check_at_bat_keying(df_savant_raw, at_bat_key='factorize'):
+    df_raw = df_savant_raw.copy()
+    df_raw['row_number'] = np.arange(len(df_raw))
+
+    df_merge, _ = clean_savant_data(df_raw.copy(), 'merge')
+    df_keyed, at_bat_ids = clean_savant_data(df_raw.copy(), at_bat_key)
+
+    #line both results up pitch by pitch
+    ids = pd.DataFrame({
+        'merge_id': df_merge.set_index('row_number')['at_bat_id'],
+        'keyed_id': df_keyed.set_index('row_number')['at_bat_id'],
+    })
+    #raised explicitly so the check still runs under python -O
+    if not len(df_merge) == len(df_keyed) == len(ids):
+        raise AssertionError('keying changed the number of pitches')
+
+    #same partition: every merge at bat maps to exactly one keyed at bat and vice versa
+    if not (ids.groupby('merge_id')['keyed_id'].nunique() == 1).all():
+        raise AssertionError('a merge at bat was split')
+    if not (ids.groupby('keyed_id')['merge_id'].nunique() == 1).all():
+        raise AssertionError('two merge at bats were combined')
+    if not (at_bat_ids['at_bat_id'].is_unique and len(at_bat_ids) == ids['keyed_id'].nunique()):
+        raise AssertionError('at_bat_ids is not one row per at bat')
+
+    return True
+
+#every value of the events column: the counted play events plus rarer statcast events
+SAVANT_EVENTS = PLAY_EVENTS + ['intent_walk', 'truncated_pa', 'runner_double_play', 'stolen_base_home', 'pickoff_error_1b',
+                               'pickoff_error_2b', 'other_advance', 'defensive_indiff', 'batter_interference',
+                               'fan_interference', 'ejection']
+
+#statcast pitch type codes
+PITCH_TYPES = ['FF', 'SI', 'FT', 'FC', 'SL', 'ST', 'SV', 'CU', 'KC', 'CS', 'CH', 'FS', 'FO', 'SC', 'KN', 'EP', 'FA', 'PO', 'IN', 'AB', 'UN']
+
+#in-memory types of the savant columns the pipeline reads
+#a list is the fixed vocabulary of a categorical column, anything else is a numpy dtype
+SAVANT_SCHEMA = {
+    'events': SAVANT_EVENTS,
+    'bb_type': CONTACT_TYPES,
+    'type': ['B', 'S', 'X'],
+    'pitch_type': PITCH_TYPES,
+    'role_key': ['SP', 'RP'],
+    'inning_topbot': ['Top', 'Bot'],
+    'p_throws': ['L', 'R'],
+    'stand': ['L', 'R'],
+    'batter': 'int32',
+    'pitcher': 'int32',
+    'game_pk': 'int32',
+    **{col: 'int32' for col in FIELDING_COLUMNS},
+    'at_bat_number': 'int16',
+    'pitch_number': 'int16',
+    'pitcher_at_bat_number': 'int16',
+    'bat_score': 'int16',
+    'post_bat_score': 'int16',
+    'times_faced': 'int8',
+    'inning': 'int8',
+    'outs_when_up': 'int8',
+    'balls': 'int8',
+    'strikes': 'int8',
+    'zone': 'int8',
+    'release_speed': 'float32',
+    'pfx_x': 'float32',
+    'pfx_z': 'float32',
+    'estimated_ba_using_speedangle': 'float32',
+    'estimated_woba_using_speedangle': 'float32',
+    'woba_value': 'float32',
+    'woba_denom': 'float32',
+}
+
+#values of savant columns that do not fit SAVANT_SCHEMA
+def savant_schema_violations(df):
+    violations = {}
+    for col, dtype in SAVANT_SCHEMA.items():
+        if col not in df.columns:
+            continue
+
+        values = pd.Series(df[col].dropna().unique())
+        if isinstance(dtype, list):
+            bad_values = values[~values.isin(dtype)]
+        elif np.issubdtype(dtype, np.integer):
+            #ids and counts have to be whole numbers inside the range of the declared type
+            limits = np.iinfo(dtype)
+            numeric = pd.to_numeric(values, errors='coerce')
+            bad_values = values[numeric.isna() | (numeric % 1 != 0) | (numeric < limits.min) | (numeric > limits.max)]
+        else:
+            bad_values = values[pd.to_numeric(values, errors='coerce').isna()]
+
+        if len(bad_values):
+            violations[col] = sorted(bad_values.tolist(), key=str)
+
+    return violations
+
+#convert savant columns to the types declared in SAVANT_SCHEMA
+def apply_savant_schema(df, errors='warn'):
+    """
+    Converts the savant columns listed in SAVANT_SCHEMA to compact types: categoricals with 
+    a fixed vocabulary, small integers and float32.
+
+    Parameters:
+    -----------
+    df : pandas.DataFrame
+        Raw or cleaned Baseball Savant pitch data. Columns missing from the schema or from df 
+        are left alone. Modified in place.
+    errors : str
+        What to do with values outside the schema (see savant_schema_violations):
+        'warn' (default) or 'raise' a ValueError listing them, or 'ignore'. Unknown categories 
+        are kept as extra categories and integer columns that do not fit stay as they are.
+
+    Returns:
+    --------
+    pandas.DataFrame
+        df with the schema types applied. Integer columns holding NaN become float32.
+    """
+    if errors not in ('warn', 'raise', 'ignore'):
+        raise ValueError(f"errors must be 'warn', 'raise' or 'ignore', got {errors!r}")
+
+    violations = savant_schema_violations(df)
+    if violations and errors != 'ignore':
+        message = 'savant data does not match SAVANT_SCHEMA: ' + '; '.join(
+            f'{col}: {values[:10]}' + (f' and {len(values) - 10} more' if len(values) > 10 else '')
+            for col, values in violations.items())
+        if errors == 'raise':
+            raise ValueError(message)
+        warnings.warn(message)
+
+    for col, dtype in SAVANT_SCHEMA.items():
+        if col not in df.columns:
+            continue
+
+        if isinstance(dtype, list):
+            df[col] = pd.Categorical(df[col], categories=dtype + violations.get(col, []))
+        elif col in violations:
+            continue
+        elif np.issubdtype(dtype, np.integer) and df[col].isna().any():
+            df[col] = df[col].astype(np.float32)
+        else:
+            df[col] = df[col].astype(dtype)
+
+    return df
+
+#read savant csv(s) with the categorical columns parsed as categories and SAVANT_SCHEMA applied
+def read_savant_csv(source_paths, usecols=None, errors='warn'):
+    if isinstance(source_paths, str):
+        source_paths = [source_paths]
+
+    dtypes = {col: 'category' for col, dtype in SAVANT_SCHEMA.items() if isinstance(dtype, list)}
+    read_columns = None if usecols is None else (lambda col: col in usecols)
+    df_savant_raw = pd.concat([pd.read_csv(path, usecols=read_columns, dtype=dtypes) for path in source_paths], ignore_index=True)
+
+    return apply_savant_schema(df_savant_raw, errors=errors)
+
+#bump when clean_savant_data changes so existing caches get rebuilt
+SAVANT_CACHE_VERSION = 2
+
+#string columns stored as categoricals and integer id columns stored as int32 in the cache
+SAVANT_CACHE_CATEGORY_COLUMNS = ['events', 'bb_type', 'type', 'pitch_type', 'pitch_name', 'description',
+                                 'role_key', 'inning_topbot', 'p_throws', 'stand', 'home_team', 'away_team', 'game_type']
+SAVANT_CACHE_INT32_COLUMNS = ['batter', 'pitcher', 'game_pk', 'year', 'at_bat_number', 'pitch_number', 'at_bat_id',
+                              'times_faced', 'pitcher_at_bat_number', 'pitcher_1', 'fielder_2_1', 'fielder_3',
+                              'fielder_4', 'fielder_5', 'fielder_6', 'fielder_7', 'fielder_8', 'fielder_9']
+
+#hash the contents of the source csv(s) so a cache is only reused for identical data
+def hash_source_files(source_paths, block_size=1 << 20):
+    import hashlib
+
+    digest = hashlib.sha256(f'savant_cache_v{SAVANT_CACHE_VERSION}'.encode())
+    for path in source_paths:
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(block_size), b''):
+                digest.update(block)
+
+    return digest.hexdigest()[:16]
+
+#set explicit dtypes so the cache round trips without re-inferring types
+def apply_savant_cache_dtypes(df):
+    for col in SAVANT_CACHE_CATEGORY_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].astype('category')
+
+    for col in SAVANT_CACHE_INT32_COLUMNS:
+        if col in df.columns and pd.api.types.is_integer_dtype(df[col]) and df[col].dtype.itemsize > 4:
+            df[col] = df[col].astype(np.int32)
+
+    return df
+
+#load the cleaned savant data from a parquet cache, rebuilding it when the source csv changes
+def load_clean_savant_data(source_paths, cache_dir='savant_cache', columns=None):
+    """
+    Returns the output of clean_savant_data, cached on disk as compressed parquet.
+
+    The cache is keyed by a content hash of the source csv(s), so it is rebuilt automatically 
+    the first time the data changes. Later runs skip read_csv and clean_savant_data entirely 
+    and read the parquet files through a memory map, optionally only the requested columns.
+
+    Every cache has a manifest recording the source paths it was built from. When a cache is 
+    rebuilt, only the caches of the same source paths (older contents or an older 
+    SAVANT_CACHE_VERSION) are removed, so different sources can share cache_dir. Caches 
+    without a manifest, from before it existed, are never removed automatically; delete 
+    them by hand.
+
+    Parameters:
+    -----------
+    source_paths : str or list of str
+        Savant csv file(s), concatenated in the given order before cleaning.
+    cache_dir : str
+        Directory holding the parquet files, shared by any number of sources.
+    columns : list of str, optional
+        Subset of df_savant columns to load (column projection). Loads everything if None.
+
+    Returns:
+    --------
+    tuple of pandas.DataFrame
+        (df_savant, at_bat_ids) as returned by clean_savant_data.
+    """
+    import os
+    import glob
+    import json
+
+    if isinstance(source_paths, str):
+        source_paths = [source_paths]
+
+    source_hash = hash_source_files(source_paths)
+    savant_path = os.path.join(cache_dir, f'{source_hash}_df_savant.parquet')
+    at_bat_ids_path = os.path.join(cache_dir, f'{source_hash}_at_bat_ids.parquet')
+    manifest_path = os.path.join(cache_dir, f'{source_hash}_manifest.json')
+    sources = [os.path.abspath(path) for path in source_paths]
+
+    if not (os.path.exists(savant_path) and os.path.exists(at_bat_ids_path)):
+        os.makedirs(cache_dir, exist_ok=True)
+
+        #clean the raw data and store it with explicit dtypes
+        df_savant_raw = read_savant_csv(source_paths)
+        df_savant, at_bat_ids = clean_savant_data(df_savant_raw)
+        del df_savant_raw
+
+        for df, path in [(apply_savant_cache_dtypes(df_savant), savant_path), (apply_savant_cache_dtypes(at_bat_ids), at_bat_ids_path)]:
+            #write to a temporary file first so an interrupted run never leaves a half written cache
+            df.to_parquet(path + '.tmp', engine='pyarrow', compression='zstd', index=False)
+            os.replace(path + '.tmp', path)
+
+        with open(manifest_path + '.tmp', 'w') as f:
+            json.dump({'sources': sources, 'version': SAVANT_CACHE_VERSION}, f)
+        os.replace(manifest_path + '.tmp', manifest_path)
+
+        #remove caches built from older versions of the same source files, other sources keep theirs
+        for other_manifest_path in glob.glob(os.path.join(cache_dir, '*_manifest.json')):
+            if other_manifest_path == manifest_path:
+                continue
+            with open(other_manifest_path) as f:
+                if json.load(f)['sources'] != sources:
+                    continue
+            other_hash = os.path.basename(other_manifest_path)[:-len('_manifest.json')]
+            for suffix in ['_df_savant.parquet', '_at_bat_ids.parquet', '_manifest.json']:
+                stale_path = os.path.join(cache_dir, other_hash + suffix)
+                if os.path.exists(stale_path):
+                    os.remove(stale_path)
+
+        if columns is None:
+            return df_savant, at_bat_ids
+        return df_savant[columns], at_bat_ids
+
+    df_savant = pd.read_parquet(savant_path, engine='pyarrow', columns=columns, memory_map=True)
+    at_bat_ids = pd.read_parquet(at_bat_ids_path, engine='pyarrow', memory_map=True)
+
+    return df_savant, at_bat_ids
+
+#start an empty set of streaming accumulators
+def new_savant_accumulator():
+    """
+    Creates the mergeable per (player, year) state used to build df_players from chunks.
+
+    'sums' and 'type_counts' hold additive counts and numerators per role, including the 
+    per at bat and per game aggregates (plate appearances, lineup slots, batters faced) of 
+    every game folded so far. 'fielding' holds the fielding counts per (player, year), 
+    'roles' the starts and appearances per pitcher and 'game_pks' the folded games. 
+    Pitches arrive grouped by game, so only the rows of the last game seen are carried 
+    ('pending') until the next chunk shows it is complete. The size of the accumulators 
+    depends on the number of player seasons and games, not on the number of pitches. At 
+    bats are keyed within their game, so unlike clean_savant_data the two games of a 
+    doubleheader never share one.
+    """
+    return {
+        'sums': {'batter': None, 'pitcher': None},
+        'type_counts': {'batter': None, 'pitcher': None},
+        'fielding': None,
+        'roles': None,
+        'game_pks': np.array([], dtype=np.int64),
+        'pending': None,
+    }
+
+#add two additive count frames, either of which may be missing
+def add_count_frames(df_a, df_b):
+    if df_a is None:
+        return df_b
+    if df_b is None:
+        return df_a
+
+    return df_a.add(df_b, fill_value=0)
+
+#fold the pitches of complete games into the accumulators
+def fold_savant_games(acc, df_rows):
+    if df_rows.empty:
+        return acc
+
+    def by_player(grouped):
+        return grouped.rename_axis(['player_mlb_id', 'year'])
+
+    #numerators and counts behind every per season mean and sum
+    in_zone = df_rows['zone'] < 10
+    woba_rows = df_rows['woba_denom'] == 1
+    fastball_rows = df_rows['pitch_type'].isin(FASTBALLS)
+    df_values = pd.DataFrame({
+        'rows': 1,
+        'runs_on_play': df_rows['runs_on_play'].fillna(0),
+        'exp_ba_sum': df_rows['estimated_ba_using_speedangle'].fillna(0),
+        'exp_ba_n': df_rows['estimated_ba_using_speedangle'].notna().astype(int),
+        'xwoba_sum': df_rows['estimated_woba_using_speedangle'].fillna(0),
+        'xwoba_n': df_rows['estimated_woba_using_speedangle'].notna().astype(int),
+        'woba_sum': df_rows['woba_value'].where(woba_rows, 0).fillna(0),
+        'woba_n': (woba_rows & df_rows['woba_value'].notna()).astype(int),
+        'woba_rows': woba_rows.astype(int),
+        'outs_recorded': df_rows['events'].isin(OUT_EVENTS).astype(int),
+        'fb_vel_sum': df_rows['release_speed'].where(fastball_rows, 0).fillna(0),
+        'fb_vel_n': (fastball_rows & df_rows['release_speed'].notna()).astype(int),
+        'fb_rows': fastball_rows.astype(int),
+        'zone_chase': (in_zone | (~in_zone & (df_rows['type'] == 'S'))).astype(int),
+    }, index=df_rows.index)
+
+    #per at bat and per game aggregates, complete within these games
+    at_bats = df_rows[['at_bat_id', 'batter', 'pitcher', 'year']].drop_duplicates('at_bat_id')
+    base_ended = df_rows.loc[(df_rows['outs_when_up'] == 2) & df_rows['events'].isin(BASEPATH_OUTS), ['batter', 'year', 'at_bat_id']]
+    bf_per_ab = df_rows.groupby(['pitcher', 'year', 'at_bat_id'])['pitcher_at_bat_number'].max().reset_index()
+
+    #lineup slot is the order of each batter's first plate appearance in their half of the game
+    first_pa = df_rows.groupby(['game_pk', 'batter', 'year', 'inning_topbot'], observed=True)['at_bat_number'].min().reset_index()
+    first_pa['lineup_position'] = first_pa.groupby(['game_pk', 'year', 'inning_topbot'], observed=True)['at_bat_number'].rank(method='first')
+
+    game_counts = {
+        'batter': pd.DataFrame({
+            'total_pa': by_player(at_bats.groupby(['batter', 'year']).size()),
+            'base_ended_inn': by_player(base_ended.groupby(['batter', 'year'])['at_bat_id'].nunique()),
+            'lineup_sum': by_player(first_pa.groupby(['batter', 'year'])['lineup_position'].sum()),
+            'lineup_n': by_player(first_pa.groupby(['batter', 'year'])['lineup_position'].count()),
+        }),
+        'pitcher': pd.DataFrame({
+            'total_bf': by_player(at_bats.groupby(['pitcher', 'year']).size()),
+            'bf_per_outing_sum': by_player(bf_per_ab.groupby(['pitcher', 'year'])['pitcher_at_bat_number'].sum()),
+            'bf_per_outing_n': by_player(bf_per_ab.groupby(['pitcher', 'year'])['pitcher_at_bat_number'].count()),
+        }),
+    }
+
+    for player_type in ['batter', 'pitcher']:
+        keys = [df_rows[player_type].rename('player_mlb_id'), df_rows['year']]
+        df_sums = pd.concat([
+            df_values.groupby(keys).sum(),
+            count_play_events(df_rows, {'events': PLAY_EVENTS, 'bb_type': CONTACT_TYPES}, player_types=[player_type]),
+            game_counts[player_type],
+        ], axis=1).fillna(0)
+        df_type_counts = count_play_events(df_rows, {'type': None}, player_types=[player_type])
+
+        acc['sums'][player_type] = add_count_frames(acc['sums'][player_type], df_sums)
+        acc['type_counts'][player_type] = add_count_frames(acc['type_counts'][player_type], df_type_counts)
+
+    fielding = df_rows[['at_bat_id', 'year'] + FIELDING_COLUMNS].drop_duplicates()
+    df_fielding = pd.concat([
+        by_player(fielding.groupby([col, 'year']).size()).rename('field_' + FIELDING_DICT[col])
+        for col in FIELDING_COLUMNS
+    ], axis=1).fillna(0)
+    acc['fielding'] = add_count_frames(acc['fielding'], df_fielding)
+
+    #'first' is the first non-null role of the pitcher in the game, in read order
+    game_roles = df_rows.groupby(['pitcher', 'game_pk'])['role_key'].first()
+    df_roles = pd.DataFrame({
+        'sp_games': (game_roles == 'SP').groupby(level='pitcher').sum(),
+        'games': game_roles.groupby(level='pitcher').count(),
+    }).rename_axis('player_mlb_id')
+    acc['roles'] = add_count_frames(acc['roles'], df_roles)
+
+    acc['game_pks'] = np.union1d(acc['game_pks'], df_rows['game_pk'].unique())
+
+    return acc
+
+#add two accumulators built from different games (acc_b is treated as coming after acc_a in the data)
+def merge_savant_accumulators(acc_a, acc_b):
+    def seen_games(acc):
+        pending = acc['pending']['game_pk'].unique() if acc['pending'] is not None else []
+        return np.union1d(acc['game_pks'], pending)
+
+    shared_games = np.intersect1d(seen_games(acc_a), seen_games(acc_b))
+    if len(shared_games):
+        raise ValueError(f'accumulators share {len(shared_games)} games (e.g. game_pk {shared_games[0]}), merge accumulators of disjoint games')
+
+    merged = new_savant_accumulator()
+    for key in ['sums', 'type_counts']:
+        for player_type in ['batter', 'pitcher']:
+            merged[key][player_type] = add_count_frames(acc_a[key][player_type], acc_b[key][player_type])
+    for key in ['fielding', 'roles']:
+        merged[key] = add_count_frames(acc_a[key], acc_b[key])
+    merged['game_pks'] = np.union1d(acc_a['game_pks'], acc_b['game_pks'])
+
+    #the last game of acc_a has no rows in acc_b, so it is complete
+    if acc_a['pending'] is not None:
+        merged = fold_savant_games(merged, acc_a['pending'])
+    merged['pending'] = acc_b['pending']
+
+    return merged
+
+#fold one chunk of raw savant rows into the accumulators
+def update_savant_accumulator(acc, df_chunk):
+    df_chunk = add_savant_columns(df_chunk)
+
+    #hash of the at bat key columns and the game stands in for at_bat_id, so at bats never span folded games
+    df_chunk['at_bat_id'] = pd.util.hash_pandas_object(df_chunk[AT_BAT_KEY_COLUMNS + ['game_pk']], index=False).values
+
+    folded_rows = df_chunk['game_pk'].isin(acc['game_pks'])
+    if folded_rows.any():
+        raise ValueError(f"pitches of game_pk {df_chunk.loc[folded_rows, 'game_pk'].iloc[0]} arrived after the game was "
+                         'folded, the pitches of a game must be contiguous')
+
+    if acc['pending'] is not None:
+        df_chunk = pd.concat([acc['pending'], df_chunk], ignore_index=True)
+    if df_chunk.empty:
+        return acc
+
+    #every game but the last one is complete, the last one may continue in the next chunk
+    last_game = df_chunk['game_pk'].to_numpy()[-1]
+    in_last_game = df_chunk['game_pk'] == last_game
+    acc = fold_savant_games(acc, df_chunk[~in_last_game])
+    acc['pending'] = df_chunk[in_last_game]
+
+    return acc
+
+#reduce accumulators to additive per (player, year) season state
+def savant_season_state_from_accumulator(acc):
+    """
+    Collapses the accumulators into per season totals that can simply be added together.
+
+    Every per at bat / per game aggregate is already a count or a sum per (player, year) 
+    (plate appearances, fielding counts, lineup slot sum, batters faced sum, starts), so 
+    state built from disjoint sets of games can be merged with merge_season_states. The 
+    pending last game is folded into a copy, acc itself can keep taking chunks.
+
+    Returns:
+    --------
+    dict
+        'batter' and 'pitcher' sums indexed by (player_mlb_id, year), 'type_counts' per role,
+        'fielding' counts, 'roles' (starts and appearances per pitcher) and the processed 'game_pks'.
+    """
+    #the stream has ended, so the last game is complete
+    if acc['pending'] is not None:
+        acc = dict(acc, sums=dict(acc['sums']), type_counts=dict(acc['type_counts']))
+        acc = fold_savant_games(acc, acc['pending'])
+
+    state = {
+        'batter': acc['sums']['batter'].fillna(0),
+        'pitcher': acc['sums']['pitcher'].fillna(0),
+        'type_counts': {player_type: df for player_type, df in acc['type_counts'].items()},
+        'fielding': acc['fielding'],
+        'roles': acc['roles'],
+        'game_pks': pd.Series(acc['game_pks'], name='game_pk'),
+    }
+
+    return state
+
+#add two season states built from disjoint sets of games
+def merge_season_states(state_a, state_b):
+    merged = {}
+    for key in ['batter', 'pitcher', 'fielding', 'roles']:
+        merged[key] = state_a[key].add(state_b[key], fill_value=0)
+    merged['type_counts'] = {
+        player_type: state_a['type_counts'][player_type].add(state_b['type_counts'][player_type], fill_value=0).fillna(0)
+        for player_type in ['batter', 'pitcher']
+    }
+    merged['game_pks'] = pd.Series(np.union1d(state_a['game_pks'], state_b['game_pks']), name='game_pk')
+
+    return merged
+
+#build df_players from season state, in the same column order as add_to_df_players
+def add_to_df_players_from_season_state(df_players, state):
+    #sums of floats stay float, every other column of the state is a count
+    batter_sums, pitcher_sums = [
+        df.astype({col: int for col in df.columns if not col.endswith('_sum') and col != 'runs_on_play'})
+        for df in (state['batter'], state['pitcher'])
+    ]
+    sums = {'batter': batter_sums, 'pitcher': pitcher_sums}
+    type_counts = {player_type: df.astype(int) for player_type, df in state['type_counts'].items()}
+
+    #merge a per (player, year) series into df_players
+    def merge_stat(df_players, stat, name):
+        return df_players.merge(stat.rename(name).reset_index(), on=['player_mlb_id', 'year'], how='left')
+
+    #mean of a summed column, missing when nothing was counted (like a groupby mean after notna filtering)
+    def role_mean(player_type, sum_col, n_col):
+        df = sums[player_type]
+        return (df[sum_col] / df[n_col]).where(df[n_col] > 0)
+
+    #remove players without an mlb Id
+    df_players = df_players[df_players['player_mlb_id'].notna()]
+
+    df_players = add_years_after_debut(df_players)
+
+    #plate appearances and batters faced
+    df_players = merge_stat(df_players, sums['batter']['total_pa'], 'total_pa')
+    df_players = merge_stat(df_players, sums['pitcher']['total_bf'], 'total_bf')
+    df_players = merge_stat(df_players, sums['batter']['base_ended_inn'], 'base_ended_inn')
+    for col in ['total_pa', 'total_bf', 'base_ended_inn']:
+        df_players[col] = df_players[col].fillna(0).astype(int)
+    df_players['total_pa'] = df_players['total_pa'] - df_players['base_ended_inn']
+
+    #fielding counts
+    field_columns = list(state['fielding'].columns)
+    df_players = df_players.merge(state['fielding'].reset_index(), on=['player_mlb_id', 'year'], how='left')
+    df_players[field_columns] = df_players[field_columns].fillna(0).astype(int)
+
+    event_columns = [f'{player_type}_{event}' for event in PLAY_EVENTS + CONTACT_TYPES for player_type in ['batter', 'pitcher']]
+    df_counts = pd.concat([sums['batter'], sums['pitcher']], axis=1)[event_columns].fillna(0).astype(int)
+    df_players = calculate_all_play_event_counts(df_players, None, df_counts)
+
+    df_players = merge_stat(df_players, role_mean('batter', 'lineup_sum', 'lineup_n'), 'avg_lineup_position')
+    df_players = calculate_batting_stats(df_players, None, type_counts)
+
+    #innings pitched from the summed outs
+    pitcher_outs = sums['pitcher']['outs_recorded']
+    df_players = df_players.merge(pd.DataFrame({'outs_recorded': pitcher_outs, 'innings_pitched': pitcher_outs / 3}).reset_index(),
+                                  on=['player_mlb_id', 'year'], how='left')
+    df_players[['outs_recorded', 'innings_pitched']] = df_players[['outs_recorded', 'innings_pitched']].fillna(0)
+
+    fb_vel = role_mean('pitcher', 'fb_vel_sum', 'fb_vel_n')
+    df_players = merge_stat(df_players, fb_vel[sums['pitcher']['fb_rows'] > 0], 'avg_fb_vel')
+    df_players = calculate_pitching_stats(df_players)
+    df_players = merge_stat(df_players, role_mean('pitcher', 'bf_per_outing_sum', 'bf_per_outing_n'), 'avg_bf_per_outing')
+    df_players = merge_stat(df_players, sums['pitcher']['zone_chase'] / sums['pitcher']['rows'], 'zone_chase_pct')
+    df_players = merge_stat(df_players, sums['batter']['runs_on_play'], 'total_runs')
+
+    for player_type in ['batter', 'pitcher']:
+        df_players = merge_stat(df_players, role_mean(player_type, 'exp_ba_sum', 'exp_ba_n').dropna(), f'{player_type}_avg_exp_ba')
+    for player_type in ['batter', 'pitcher']:
+        woba = role_mean(player_type, 'woba_sum', 'woba_n')
+        df_players = merge_stat(df_players, woba[sums[player_type]['woba_rows'] > 0], f'{player_type}_avg_woba')
+    for player_type in ['batter', 'pitcher']:
+        df_players = merge_stat(df_players, role_mean(player_type, 'xwoba_sum', 'xwoba_n').dropna(), f'{player_type}_avg_xwoba')
+
+    df_players = primary_position(df_players)
+
+    #percentage of appearances as a starter
+    sp_percentage = state['roles']['sp_games'] / state['roles']['games'] * 100
+    df_players = df_players.merge(sp_percentage.rename('sp_pct'), left_on='player_mlb_id', right_index=True, how='left')
+    df_players['starter'] = (df_players['sp_pct'] > 75).astype(int)
+    df_players['reliever'] = (df_players['sp_pct'] < 25).astype(int)
+    df_players['both_starter_reliever'] = ((df_players['sp_pct'] > 25) & (df_players['sp_pct'] < 75)).astype(int)
+
+    df_players = add_age_columns(df_players)
+
+    return df_players
+
+#stream the savant csv(s) into season state
+def build_season_state(source_paths, chunksize=500_000):
+    if isinstance(source_paths, str):
+        source_paths = [source_paths]
+
+    acc = new_savant_accumulator()
+    for path in source_paths:
+        for df_chunk in pd.read_csv(path, chunksize=chunksize):
+            acc = update_savant_accumulator(acc, apply_savant_schema(df_chunk))
+
+    return savant_season_state_from_accumulator(acc)
+
+#build df_players by streaming the savant csv(s) in chunks instead of loading them whole
+def add_to_df_players_streaming(df_players, source_paths, chunksize=500_000):
+    """
+    Streaming version of clean_savant_data + add_to_df_players.
+
+    The source csv(s) are read chunksize rows at a time and each chunk is folded into 
+    mergeable accumulators (see new_savant_accumulator), so peak memory is set by the 
+    chunk size and the number of player seasons rather than by the number of pitches. 
+    The pitches of a game must be contiguous in the csv(s), as in Savant exports. The returned df_players has the same columns as add_to_df_players.
+
+    Parameters:
+    -----------
+    df_players : pandas.DataFrame
+        Player season frame (people x years) as passed to add_to_df_players.
+    source_paths : str or list of str
+        Savant csv file(s) to stream, e.g. one per season.
+    chunksize : int
+        Number of pitches read per chunk.
+
+    Returns:
+    --------
+    pandas.DataFrame
+        Updated df_players.
+    """
+    state = build_season_state(source_paths, chunksize)
+
+    return add_to_df_players_from_season_state(df_players, state)
+
+#write season state to parquet files so nightly updates can build on it
+def save_season_state(state, state_dir='savant_state'):
+    import os
+
+    os.makedirs(state_dir, exist_ok=True)
+    frames = {
+        'batter': state['batter'],
+        'pitcher': state['pitcher'],
+        'type_counts_batter': state['type_counts']['batter'],
+        'type_counts_pitcher': state['type_counts']['pitcher'],
+        'fielding': state['fielding'],
+        'roles': state['roles'],
+        'game_pks': state['game_pks'].to_frame(),
+    }
+    for name, df in frames.items():
+        path = os.path.join(state_dir, f'{name}.parquet')
+        df.to_parquet(path + '.tmp', engine='pyarrow')
+        os.replace(path + '.tmp', path)
+
+#read season state written by save_season_state (None if there is none yet)
+def load_season_state(state_dir='savant_state'):
+    import os
+
+    if not os.path.exists(os.path.join(state_dir, 'game_pks.parquet')):
+        return None
+
+    def read(name):
+        return pd.read_parquet(os.path.join(state_dir, f'{name}.parquet'), engine='pyarrow')
+
+    state = {
+        'batter': read('batter'),
+        'pitcher': read('pitcher'),
+        'type_counts': {'batter': read('type_counts_batter'), 'pitcher': read('type_counts_pitcher')},
+        'fielding': read('fielding'),
+        'roles': read('roles'),
+        'game_pks': read('game_pks')['game_pk'],
+    }
+
+    return state
+
+#add newly arrived games to the persisted season state and refresh only the players they touch
+def refresh_df_players_incremental(df_players_full, df_players, df_new_pitches, state_dir='savant_state'):
+    """
+    Incrementally updates df_players with games that have not been processed yet.
+
+    Pitches from game_pks already in the saved season state are ignored, so rerunning a 
+    night is harmless. At bats are keyed by a hash of the at bat columns, which is stable 
+    across runs (unlike the running at_bat_id of clean_savant_data). The new games are 
+    reduced to season totals, added to the saved state, and the derived stats (ops, whip, 
+    babip, k/bb, primary position, sp %, ...) are recomputed only for the players that 
+    appear in them. The cost is proportional to the new pitches plus the affected rows.
+
+    Games must arrive complete: the lineup slot and appearance role of a game are taken 
+    from the pitches present when it is first processed.
+
+    Parameters:
+    -----------
+    df_players_full : pandas.DataFrame or None
+        Previous output (of this function or add_to_df_players_from_season_state). None 
+        rebuilds every row from the state, e.g. on the first run.
+    df_players : pandas.DataFrame
+        Player season frame (people x years) used to build the refreshed rows.
+    df_new_pitches : pandas.DataFrame
+        Raw savant rows for the new games. On the first run, pass the full history.
+    state_dir : str
+        Directory of the persisted season state.
+
+    Returns:
+    --------
+    pandas.DataFrame
+        df_players_full with the affected players' rows replaced.
+    """
+    state = load_season_state(state_dir)
+
+    #skip games that are already part of the state
+    if state is not None:
+        df_new_pitches = df_new_pitches[~df_new_pitches['game_pk'].isin(state['game_pks'])]
+    if df_new_pitches.empty and df_players_full is not None:
+        return df_players_full
+
+    acc = update_savant_accumulator(new_savant_accumulator(), df_new_pitches.copy())
+    state_new = savant_season_state_from_accumulator(acc)
+    state = state_new if state is None else merge_season_states(state, state_new)
+    save_season_state(state, state_dir)
+
+    if df_players_full is None:
+        return add_to_df_players_from_season_state(df_players, state)
+
+    #every player who batted, pitched or fielded in the new games, all of their seasons
+    affected_players = pd.unique(df_new_pitches[['batter', 'pitcher'] + FIELDING_COLUMNS].to_numpy().ravel())
+    df_affected = add_to_df_players_from_season_state(df_players[df_players['player_mlb_id'].isin(affected_players)], state)
+
+    #put the refreshed rows back in their original positions, new player seasons go at the end
+    df_players_full = df_players_full.reset_index(drop=True)
+    full_keys = pd.MultiIndex.from_frame(df_players_full[['player_mlb_id', 'year']])
+    positions = full_keys.get_indexer(pd.MultiIndex.from_frame(df_affected[['player_mlb_id', 'year']]))
+    df_affected.index = np.where(positions >= 0, positions, len(df_players_full) + np.arange(len(df_affected)))
+
+    df_players_full = pd.concat([df_players_full[~df_players_full['player_mlb_id'].isin(affected_players)], df_affected]).sort_index()
+
+    return df_players_full
+
+#PA/BF weighted mean of every stat per group, skipping missing values column by column
+def weighted_group_means(df, stat_cols, weight_col, by):
+    """
+    Weighted baselines (league or position averages) in one grouped pass.
+
+    Same result as applying np.average(col.dropna(), weights=...) to every column of every 
+    group: each stat is weighted by weight_col over the rows where it is present, and groups 
+    whose weights sum to 0 fall back to the plain mean. weight_col itself gets its plain mean.
+
+    Parameters:
+    -----------
+    df : pandas.DataFrame
+        Long player season data (one row per player and year).
+    stat_cols : list of str
+        Stats to average.
+    weight_col : str
+        Weight column, e.g. 'total_pa' or 'total_bf'.
+    by : str or list of str
+        Group columns, e.g. 'year' or ['year', 'primary_position'].
+
+    Returns:
+    --------
+    pandas.DataFrame
+        One row per group with the averaged stats and weight_col.
+    """
+    by = [by] if isinstance(by, str) else list(by)
+    keys = [df[col] for col in by]
+
+    values = df[stat_cols].to_numpy(dtype=float)
+    weights = df[weight_col].to_numpy(dtype=float)[:, None]
+    present = ~np.isnan(values)
+
+    weighted_sums = pd.DataFrame(np.where(present, values * weights, 0), index=df.index, columns=stat_cols).groupby(keys).sum()
+    weight_sums = pd.DataFrame(np.where(present, weights, 0), index=df.index, columns=stat_cols).groupby(keys).sum()
+    plain_means = df[stat_cols].groupby(keys).mean()
+
+    df_means = (weighted_sums / weight_sums).where(weight_sums > 0, plain_means)
+    df_means[weight_col] = df[weight_col].groupby(keys).mean()
+
+    return df_means
+
+#weight each player's prior seasons into one row per target year
+def blend_seasons(df, stat_cols, weight_col, weights=(5, 3), target_years=None, key='player_mlb_id', year_col='year'):
+    """
+    N-season weighted blend of long player season data.
+
+    For a target year T, the season T-1 gets weights[0], T-2 gets weights[1] and so on, so 
+    the window length is len(weights). Every stat is averaged with weight season_weight * 
+    weight_col over the seasons where it is present, and weight_col is blended as 
+    sum(season_weight * weight_col) / sum(weights), counting missing seasons as 0 (the 
+    5/3 PA weighting of 2.Batter_Features is weights=(5, 3)). All players and target years 
+    are computed together with one grouped sum.
+
+    Parameters:
+    -----------
+    df : pandas.DataFrame
+        Long player season data with key, year_col, weight_col and stat_cols.
+    stat_cols : list of str
+        Rate stats to blend.
+    weight_col : str
+        Playing time column, e.g. 'total_pa' or 'total_bf'.
+    weights : sequence of float
+        Season weights, most recent season first.
+    target_years : list of int, optional
+        Years to build. Defaults to every year reachable from the data.
+    key, year_col : str
+        Player and season columns.
+
+    Returns:
+    --------
+    pandas.DataFrame
+        One row per (key, target year) that has at least one season in the window.
+    """
+    weights = np.asarray(weights, dtype=float)
+    window = len(weights)
+
+    #every season row contributes to the next `window` target years
+    rows = np.repeat(np.arange(len(df)), window)
+    lags = np.tile(np.arange(1, window + 1), len(df))
+    targets = df[year_col].to_numpy()[rows] + lags
+    if target_years is not None:
+        keep = np.isin(targets, target_years)
+        rows, lags, targets = rows[keep], lags[keep], targets[keep]
+
+    season_weights = weights[lags - 1] * df[weight_col].to_numpy(dtype=float)[rows]
+    values = df[stat_cols].to_numpy(dtype=float)[rows]
+    present = ~np.isnan(values)
+
+    keys = [df[key].to_numpy()[rows], targets]
+    numerators = pd.DataFrame(np.where(present, values * season_weights[:, None], 0), columns=stat_cols).groupby(keys).sum()
+    denominators = pd.DataFrame(np.where(present, season_weights[:, None], 0), columns=stat_cols).groupby(keys).sum()
+
+    df_blended = numerators / denominators.where(denominators != 0)
+    df_blended[weight_col] = pd.Series(season_weights).groupby(keys).sum() / weights.sum()
+    df_blended.index.names = [key, year_col]
+
+    return df_blended.reset_index()
+
+#shrink stats toward their group mean by a fixed amount of playing time
+def regress_to_group_mean(df, stat_cols, weight_col, group_means, group_col, regression_weight=5):
+    """
+    Regression to the mean: (stat * weight + group_mean * regression_weight) / (weight + regression_weight).
+
+    Parameters:
+    -----------
+    df : pandas.DataFrame
+        Player rows with stat_cols, weight_col and group_col.
+    stat_cols : list of str
+        Stats to regress.
+    weight_col : str
+        Playing time of each row (e.g. blended 'total_pa').
+    group_means : pandas.DataFrame
+        Means indexed by the group value(s), e.g. weighted_group_means(..., by='primary_position').
+    group_col : str or list of str
+        Column(s) of df matching the index of group_means.
+    regression_weight : float
+        Playing time worth of the group mean added to every player (5 PA/BF in the notebooks).
+
+    Returns:
+    --------
+    pandas.DataFrame
+        Copy of df with the regressed stats.
+    """
+    if isinstance(group_col, str):
+        group_index = pd.Index(df[group_col])
+    else:
+        group_index = pd.MultiIndex.from_frame(df[list(group_col)])
+
+    means = group_means[stat_cols].reindex(group_index).to_numpy(dtype=float)
+    weights = df[weight_col].to_numpy(dtype=float)[:, None]
+
+    df_regressed = df.copy()
+    df_regressed[stat_cols] = (df[stat_cols].to_numpy(dtype=float) * weights + means * regression_weight) / (weights + regression_weight)
+
+    return df_regressed
+
+#per pitch numerators and denominators of the as-of-date and rolling window features
+def rolling_pitch_columns(df_savant):
+    #a plate appearance / batter faced is counted on the first pitch of the at bat
+    first_batter = ~df_savant.duplicated(['batter', 'at_bat_id']).to_numpy()
+    first_pitcher = ~df_savant.duplicated(['pitcher', 'at_bat_id']).to_numpy()
+
+    #at bats that ended the inning on the bases are not plate appearances (see compute_player_pa_and_bf)
+    base_ended = ((df_savant['outs_when_up'] == 2) & df_savant['events'].isin(BASEPATH_OUTS)).to_numpy()
+    base_ended_first = base_ended.copy()
+    base_ended_first[base_ended] = ~df_savant.loc[base_ended, ['batter', 'at_bat_id']].duplicated().to_numpy()
+
+    #highest pitcher_at_bat_number of every at bat, kept on its first pitch (see calculate_batters_faced_in_game)
+    bf_outing = df_savant.groupby(['pitcher', 'at_bat_id'])['pitcher_at_bat_number'].transform('max').where(first_pitcher)
+
+    in_zone = df_savant['zone'] < 10
+    fastball_speed = df_savant['release_speed'].where(df_savant['pitch_type'].isin(FASTBALLS))
+    woba_value = df_savant['woba_value'].where(df_savant['woba_denom'] == 1)
+
+    return pd.DataFrame({
+        'plate_appearances': first_batter.astype(np.int64) - base_ended_first,
+        'batters_faced': first_pitcher.astype(np.int64),
+        'pitches': np.ones(len(df_savant), dtype=np.int64),
+        'strikeouts': (df_savant['events'] == 'strikeout').to_numpy(dtype=np.int64),
+        'walks': (df_savant['events'] == 'walk').to_numpy(dtype=np.int64),
+        'xwoba_sum': df_savant['estimated_woba_using_speedangle'].fillna(0).to_numpy(dtype=float),
+        'xwoba_n': df_savant['estimated_woba_using_speedangle'].notna().to_numpy(dtype=np.int64),
+        'exp_ba_sum': df_savant['estimated_ba_using_speedangle'].fillna(0).to_numpy(dtype=float),
+        'exp_ba_n': df_savant['estimated_ba_using_speedangle'].notna().to_numpy(dtype=np.int64),
+        'woba_sum': woba_value.fillna(0).to_numpy(dtype=float),
+        'woba_n': woba_value.notna().to_numpy(dtype=np.int64),
+        'fb_vel_sum': fastball_speed.fillna(0).to_numpy(dtype=float),
+        'fastballs': fastball_speed.notna().to_numpy(dtype=np.int64),
+        'zone_chase': (in_zone | (~in_zone & (df_savant['type'] == 'S'))).to_numpy(dtype=np.int64),
+        'bf_outing_sum': bf_outing.fillna(0).to_numpy(dtype=float),
+        'bf_outing_n': bf_outing.notna().to_numpy(dtype=np.int64),
+    })
+
+#features available as of a date or over a trailing window, as numerator / denominator of rolling_pitch_columns
+ROLLING_FEATURES = {
+    'k_rate_batter': {'role': 'batter', 'numerator': 'strikeouts', 'denominator': 'plate_appearances'},
+    'bb_rate_batter': {'role': 'batter', 'numerator': 'walks', 'denominator': 'plate_appearances'},
+    'batter_avg_xwoba': {'role': 'batter', 'numerator': 'xwoba_sum', 'denominator': 'xwoba_n'},
+    'batter_avg_exp_ba': {'role': 'batter', 'numerator': 'exp_ba_sum', 'denominator': 'exp_ba_n'},
+    'batter_avg_woba': {'role': 'batter', 'numerator': 'woba_sum', 'denominator': 'woba_n'},
+    'k_rate_pitcher': {'role': 'pitcher', 'numerator': 'strikeouts', 'denominator': 'batters_faced'},
+    'bb_rate_pitcher': {'role': 'pitcher', 'numerator': 'walks', 'denominator': 'batters_faced'},
+    'pitcher_avg_xwoba': {'role': 'pitcher', 'numerator': 'xwoba_sum', 'denominator': 'xwoba_n'},
+    'pitcher_avg_exp_ba': {'role': 'pitcher', 'numerator': 'exp_ba_sum', 'denominator': 'exp_ba_n'},
+    'pitcher_avg_woba': {'role': 'pitcher', 'numerator': 'woba_sum', 'denominator': 'woba_n'},
+    'avg_fb_vel': {'role': 'pitcher', 'numerator': 'fb_vel_sum', 'denominator': 'fastballs'},
+    'zone_chase_pct': {'role': 'pitcher', 'numerator': 'zone_chase', 'denominator': 'pitches'},
+    'avg_bf_per_outing': {'role': 'pitcher', 'numerator': 'bf_outing_sum', 'denominator': 'bf_outing_n'},
+}
+
+#convert dates to whole days since the epoch
+def dates_to_days(dates):
+    return pd.to_datetime(dates).to_numpy().astype('datetime64[D]').astype(np.int64)
+
+#build per player, date sorted cumulative sums for the rolling features
+def build_rolling_feature_store(df_savant, features=None):
+    """
+    Builds the time-indexed store behind query_rolling_features.
+
+    The per pitch numerators and denominators are summed per (player, day) for each role, 
+    sorted by player and day, and accumulated into one cumulative sum array per role. The 
+    total over any span of days is then two searchsorted lookups and a subtraction.
+
+    Parameters:
+    -----------
+    df_savant : pandas.DataFrame
+        Cleaned Baseball Savant pitch data.
+    features : list of str, optional
+        Keys of ROLLING_FEATURES to index. All of them if None.
+
+    Returns:
+    --------
+    dict
+        'features' (the ROLLING_FEATURES entries indexed) and 'roles', which maps 'batter' and 
+        'pitcher' to the sorted 'players', the (player code, day) 'keys', the summed 'columns' 
+        and their 'cumsums' (one leading row of zeros).
+    """
+    features = list(ROLLING_FEATURES) if features is None else features
+    store = {'features': {name: ROLLING_FEATURES[name] for name in features}, 'roles': {}}
+
+    df_pitch = rolling_pitch_columns(df_savant)
+    days = dates_to_days(df_savant['game_date'])
+
+    for role in ['batter', 'pitcher']:
+        columns = []
+        for feature in store['features'].values():
+            if feature['role'] == role:
+                columns += [col for col in [feature['numerator'], feature['denominator']] if col not in columns]
+        if not columns:
+            continue
+
+        #daily totals, sorted by player then day
+        df_daily = df_pitch[columns].groupby([df_savant[role].to_numpy(), days]).sum()
+        daily_players = df_daily.index.get_level_values(0).to_numpy()
+        players = np.unique(daily_players)
+
+        store['roles'][role] = {
+            'players': players,
+            'keys': np.searchsorted(players, daily_players).astype(np.int64) * 2**32 + df_daily.index.get_level_values(1).to_numpy(),
+            'columns': columns,
+            'cumsums': np.vstack([np.zeros((1, len(columns))), np.cumsum(df_daily.to_numpy(dtype=float), axis=0)]),
+        }
+
+    return store
+
+#answer many (player, date, window) queries against a rolling feature store in one vectorized call
+def query_rolling_features(store, df_queries, features=None):
+    """
+    Computes features as of a date, season to date or over a trailing window of days.
+
+    Parameters:
+    -----------
+    store : dict
+        Output of build_rolling_feature_store.
+    df_queries : pandas.DataFrame
+        One row per query with 'player_mlb_id', 'date' and optionally 'window_days'. Games on 
+        'date' are included, so use the day before a game for pre-game values. A missing or 
+        NaN window_days means season to date; otherwise the window covers the window_days 
+        days ending on 'date' and can reach back into the previous season.
+    features : list of str, optional
+        Features to return, all features of the store if None.
+
+    Returns:
+    --------
+    pandas.DataFrame
+        Copy of df_queries with one column per feature. Players without a denominator in the 
+        window get NaN.
+    """
+    features = list(store['features']) if features is None else features
+
+    days = dates_to_days(df_queries['date'])
+    if 'window_days' in df_queries.columns:
+        window_days = df_queries['window_days'].to_numpy(dtype=float)
+    else:
+        window_days = np.full(len(df_queries), np.nan)
+
+    #first day counted: january 1st of the season, or the start of the window
+    season_start = days.astype('datetime64[D]').astype('datetime64[Y]').astype('datetime64[D]').astype(np.int64)
+    start_days = np.where(np.isnan(window_days), season_start, days - np.nan_to_num(window_days).astype(np.int64) + 1)
+
+    df_result = df_queries.copy()
+    player_ids = df_queries['player_mlb_id'].to_numpy()
+
+    for role, entry in store['roles'].items():
+        role_features = [name for name in features if store['features'][name]['role'] == role]
+        if not role_features:
+            continue
+
+        #locate every query's player, then both ends of its span inside the player's days
+        player_codes = np.searchsorted(entry['players'], player_ids)
+        found = entry['players'][np.minimum(player_codes, len(entry['players']) - 1)] == player_ids
+        player_keys = player_codes.astype(np.int64) * 2**32
+        stop = np.searchsorted(entry['keys'], player_keys + days, side='right')
+        start = np.searchsorted(entry['keys'], player_keys + start_days, side='left')
+
+        totals = entry['cumsums'][stop] - entry['cumsums'][start]
+        totals[~found] = np.nan
+
+        for name in role_features:
+            numerator = totals[:, entry['columns'].index(store['features'][name]['numerator'])]
+            denominator = totals[:, entry['columns'].index(store['features'][name]['denominator'])]
+            with np.errstate(divide='ignore', invalid='ignore'):
+                df_result[name] = np.where(denominator > 0, numerator / denominator, np.nan)
+
+    return df_result
+
+#numbering of the rows within each group of equal keys, in row order
+def cumcount_by_key(keys):
+    order = np.argsort(keys, kind='stable')
+    sorted_keys = keys[order]
+    new_group = np.ones(len(keys), dtype=bool)
+    new_group[1:] = sorted_keys[1:] != sorted_keys[:-1]
+    positions = np.arange(len(keys))
+    group_start = np.maximum.accumulate(np.where(new_group, positions, 0))
+
+    counts = np.empty(len(keys), dtype=np.int64)
+    counts[order] = positions - group_start
+
+    return counts
+
+#plate appearance outcomes of the synthetic data: event -> share of outs or of non-outs
+SYNTHETIC_OUT_EVENTS = {
+    'field_out': 0.555, 'strikeout': 0.330, 'force_out': 0.026, 'grounded_into_double_play': 0.024,
+    'sac_fly': 0.011, 'fielders_choice_out': 0.006, 'sac_bunt': 0.005, 'double_play': 0.003,
+    'caught_stealing_2b': 0.003, 'strikeout_double_play': 0.002, 'other_out': 0.002, 'pickoff_1b': 0.001,
+    'caught_stealing_3b': 0.001, 'triple_play': 0.001,
+}
+SYNTHETIC_ON_BASE_EVENTS = {
+    'single': 0.440, 'walk': 0.262, 'double': 0.139, 'home_run': 0.098, 'hit_by_pitch': 0.034,
+    'field_error': 0.012, 'triple': 0.008, 'fielders_choice': 0.004, 'catcher_interf': 0.002, 'stolen_base_2b': 0.001,
+}
+
+#pitch mix of the synthetic data: pitch type -> (share, mean release speed, mean pfx_x, mean pfx_z)
+SYNTHETIC_PITCH_TYPES = {
+    'FF': (0.33, 94.0, -0.6, 1.3), 'SI': (0.15, 93.2, -1.2, 0.7), 'SL': (0.17, 85.0, 0.4, 0.2),
+    'CH': (0.11, 85.5, -1.1, 0.5), 'CU': (0.08, 79.0, 0.7, -0.8), 'FC': (0.07, 89.0, 0.2, 0.6),
+    'ST': (0.05, 81.5, 1.2, 0.1), 'FS': (0.04, 86.0, -0.8, 0.2),
+}
+
+#deterministic synthetic savant pitch data and a matching people table for tests and benchmarks
+def generate_synthetic_savant(n_pitches=100_000, n_seasons=3, first_year=2021, seed=0, n_teams=30, inactive_people_ratio=5):
+    """
+    Generates a pitch level table with the columns and value distributions of the Baseball 
+    Savant export used by the notebooks, plus a matching Lahman style people table.
+
+    Teams carry 13 position players and 13 pitchers (5 starters in a rotation and 8 relievers) 
+    with turnover between seasons. Every game has 9 innings of half innings ending on the 
+    third out, a batting order that cycles, starters going 5 to 7 innings, and pitch counts, 
+    zones, pitch types, events, batted ball types, scores and expected stats drawn from 
+    fixed MLB-like distributions. Everything is vectorized, so 50M pitches take about as 
+    long to generate as to write out.
+
+    Parameters:
+    -----------
+    n_pitches : int
+        Approximate number of pitches (the number of games is n_pitches / 307).
+    n_seasons : int
+        Number of seasons, starting at first_year. Games are spread evenly over the seasons.
+    first_year : int
+        First season.
+    seed : int
+        Seed of the random generator; the same arguments always give the same data.
+    n_teams : int
+        Number of teams.
+    inactive_people_ratio : float
+        People rows without any pitch per active player, like retired players in Lahman 
+        (half of them without a player_mlb_id).
+
+    Returns:
+    --------
+    tuple of pandas.DataFrame
+        (df_savant_raw, df_people). df_savant_raw is newest game first, like the savant 
+        export, with string columns as categoricals and game_date as datetime. 
+        df_people has playerID, player_mlb_id, nameFirst, nameLast, birthYear, debut 
+        ('M/D/YYYY'), bats and throws.
+    """
+    rng = np.random.default_rng(seed)
+    id_base = 400000
+    n_hitters, n_pitchers = 13, 13
+
+    #rosters per season and team, 20% of each roster replaced every season
+    roster = np.empty((n_seasons, n_teams, n_hitters + n_pitchers), dtype=np.int64)
+    n_ids = n_teams * (n_hitters + n_pitchers)
+    roster[0] = id_base + np.arange(n_ids).reshape(n_teams, -1)
+    for season in range(1, n_seasons):
+        roster[season] = roster[season - 1]
+        replaced = rng.random((n_teams, n_hitters + n_pitchers)) < 0.2
+        roster[season][replaced] = id_base + n_ids + np.arange(replaced.sum())
+        n_ids += replaced.sum()
+    hitter_ids, pitcher_ids = roster[:, :, :n_hitters], roster[:, :, n_hitters:]
+
+    #player attributes indexed by id - id_base
+    is_pitcher = np.zeros(n_ids, dtype=bool)
+    is_pitcher[pitcher_ids.ravel() - id_base] = True
+    first_season = np.full(n_ids, n_seasons)
+    for season in range(n_seasons - 1, -1, -1):
+        first_season[roster[season].ravel() - id_base] = season
+    #hands coded 0 = L, 1 = R, 2 = B (switch hitter)
+    throws = (rng.random(n_ids) < np.where(is_pitcher, 0.72, 0.88)).astype(np.int64)
+    bats = np.where(is_pitcher, throws, rng.choice(3, n_ids, p=[0.33, 0.55, 0.12]))
+    fastball_offset = rng.normal(0, 1.8, n_ids)
+
+    #schedule: games spread over the seasons, dates between april 1st and the end of september
+    n_games = max(1, int(round(n_pitches / 307)))
+    game_season = np.sort(np.arange(n_games) % n_seasons)
+    game_day = rng.integers(0, 183, n_games)
+    order = np.lexsort((game_day, game_season))
+    game_season, game_day = game_season[order], game_day[order]
+    season_start = np.array([f'{first_year + season}-04-01' for season in range(n_seasons)], dtype='datetime64[D]')
+    game_date = season_start[game_season] + game_day
+    game_teams = rng.random((n_games, n_teams)).argsort(axis=1)[:, :2]
+
+    #game sides (away = 0, home = 1), indexed game * 2 + side
+    side_team = game_teams.ravel()
+    side_season = np.repeat(game_season, 2)
+    n_sides = 2 * n_games
+    side_rows = np.arange(n_sides)
+
+    #lineups by position (c, 1b, 2b, 3b, ss, lf, cf, rf, dh); each bench player may start at one position
+    lineup_by_position = hitter_ids[side_season, side_team, :9].copy()
+    for bench in range(4):
+        starts = rng.random(n_sides) < 0.25
+        lineup_by_position[side_rows[starts], rng.integers(0, 9, starts.sum())] = hitter_ids[side_season[starts], side_team[starts], 9 + bench]
+
+    #batting order: a team specific order by position with some game to game shuffling
+    order_key = rng.permutation(9 * n_teams).reshape(n_teams, 9)[side_team] + rng.normal(0, 6, (n_sides, 9))
+    lineup = np.take_along_axis(lineup_by_position, order_key.argsort(axis=1), axis=1)
+
+    #five man rotation, starters go 5 to 7 innings, then one reliever per inning
+    rotation_slot = cumcount_by_key(side_season.astype(np.int64) * n_teams + side_team) % 5
+    starter = pitcher_ids[side_season, side_team, rotation_slot]
+    starter_innings = rng.integers(5, 8, n_sides)
+    relievers = pitcher_ids[side_season[:, None], side_team[:, None], rng.integers(5, n_pitchers, (n_sides, 9))]
+
+    #half innings with 3 + poisson(1.25) plate appearances, the last one and two others are outs
+    n_halves = 18 * n_games
+    half_pa = 3 + rng.poisson(1.25, n_halves)
+    half_start = np.cumsum(half_pa) - half_pa
+    pa_half = np.repeat(np.arange(n_halves), half_pa)
+    n_pa = len(pa_half)
+    pa_position = np.arange(n_pa) - half_start[pa_half]
+    pa_last = pa_position == half_pa[pa_half] - 1
+    out_key = rng.random(n_pa)
+    out_key[pa_last] = 2
+    out_order = np.lexsort((out_key, pa_half))
+    out_rank = np.empty(n_pa, dtype=np.int64)
+    out_rank[out_order] = np.arange(n_pa) - half_start[pa_half[out_order]]
+    is_out = pa_last | (out_rank < 2)
+    outs_so_far = np.cumsum(is_out)
+    outs_when_up = outs_so_far - is_out - (outs_so_far[half_start] - is_out[half_start])[pa_half]
+
+    pa_game = pa_half // 18
+    inning = (pa_half % 18) // 2 + 1
+    topbot = pa_half % 2
+    batting_side = pa_game * 2 + topbot
+    fielding_side = pa_game * 2 + 1 - topbot
+
+    #outcomes as codes into SAVANT_EVENTS, with double plays turned into plain outs when there are already two outs
+    event_codes = lambda names: np.array([SAVANT_EVENTS.index(name) for name in names])
+    events = np.empty(n_pa, dtype=np.int64)
+    for mask, shares in [(is_out, SYNTHETIC_OUT_EVENTS), (~is_out, SYNTHETIC_ON_BASE_EVENTS)]:
+        p = np.array(list(shares.values()))
+        events[mask] = event_codes(shares)[rng.choice(len(shares), mask.sum(), p=p / p.sum())]
+    events[(outs_when_up == 2) & np.isin(events, event_codes(['grounded_into_double_play', 'double_play', 'strikeout_double_play', 'triple_play']))] = SAVANT_EVENTS.index('field_out')
+
+    #batters cycle through the order, pitchers follow the starter / bullpen plan
+    batter = lineup[batting_side, cumcount_by_key(batting_side) % 9]
+    is_starter = inning <= starter_innings[fielding_side]
+    pitcher = np.where(is_starter, starter[fielding_side], relievers[fielding_side, inning - 1])
+    fielders = lineup_by_position[fielding_side, :8]
+    at_bat_number = cumcount_by_key(pa_game) + 1
+    times_faced = cumcount_by_key((pa_game << 40) | ((pitcher - id_base) << 20) | (batter - id_base)) + 1
+    pitcher_at_bat_number = cumcount_by_key((pa_game << 20) | (pitcher - id_base)) + 1
+
+    #runs scored on the play and the batting team's score before it
+    run_chance = np.zeros(len(SAVANT_EVENTS))
+    run_chance[event_codes(['single', 'double', 'triple', 'home_run', 'sac_fly', 'field_error', 'fielders_choice', 'walk', 'hit_by_pitch'])] = [
+        0.25, 0.4, 0.6, 1.0, 1.0, 0.2, 0.1, 0.05, 0.05]
+    runs = (rng.random(n_pa) < run_chance[events]).astype(np.int64)
+    runs += (events == SAVANT_EVENTS.index('home_run')) * rng.binomial(3, 0.25, n_pa)
+    side_order = np.argsort(batting_side, kind='stable')
+    sorted_runs = runs[side_order]
+    runs_before = np.cumsum(sorted_runs) - sorted_runs
+    side_first = np.searchsorted(batting_side[side_order], batting_side[side_order])
+    bat_score = np.empty(n_pa, dtype=np.int64)
+    bat_score[side_order] = runs_before - runs_before[side_first]
+
+    #pitches per plate appearance: strikeouts need 3 strikes and walks 4 balls
+    is_strikeout = np.isin(events, event_codes(['strikeout', 'strikeout_double_play']))
+    is_walk = events == SAVANT_EVENTS.index('walk')
+    pa_pitches = np.where(is_strikeout, 3 + rng.poisson(1.8, n_pa), np.where(is_walk, 4 + rng.poisson(1.2, n_pa), 1 + rng.poisson(2.6, n_pa)))
+    pitch_pa = np.repeat(np.arange(n_pa), pa_pitches)
+    n_rows = len(pitch_pa)
+    pitch_number = np.arange(n_rows) - (np.cumsum(pa_pitches) - pa_pitches)[pitch_pa] + 1
+    last_pitch = pitch_number == pa_pitches[pitch_pa]
+
+    in_play_events = ['field_out', 'force_out', 'grounded_into_double_play', 'sac_fly', 'fielders_choice_out', 'sac_bunt',
+                      'double_play', 'other_out', 'triple_play', 'single', 'double', 'home_run', 'field_error', 'triple', 'fielders_choice']
+    pa_in_play = np.isin(events, event_codes(in_play_events))
+    pitch_events = np.where(last_pitch, events[pitch_pa], -1)
+    pitch_in_play = last_pitch & pa_in_play[pitch_pa]
+
+    #pitch result: in play on the last pitch of balls in play, otherwise strikes and balls
+    pitch_type_codes = np.where(rng.random(n_rows) < 0.55, 1, 0)
+    pitch_type_codes[last_pitch & is_strikeout[pitch_pa]] = 1
+    pitch_type_codes[last_pitch & np.isin(events, event_codes(['walk', 'hit_by_pitch']))[pitch_pa]] = 0
+    pitch_type_codes[pitch_in_play] = 2
+
+    #batted ball type, forced for ground ball and fly ball plays
+    bb_type = rng.choice(len(CONTACT_TYPES), n_rows, p=[0.23, 0.26, 0.44, 0.07])
+    bb_type[np.isin(pitch_events, event_codes(['grounded_into_double_play', 'force_out', 'fielders_choice_out', 'fielders_choice', 'sac_bunt', 'double_play']))] = CONTACT_TYPES.index('ground_ball')
+    bb_type[np.isin(pitch_events, event_codes(['sac_fly', 'home_run']))] = CONTACT_TYPES.index('fly_ball')
+    bb_type[~pitch_in_play] = -1
+
+    #pitch types, speeds and movement
+    pitch_types = list(SYNTHETIC_PITCH_TYPES)
+    pitch_type = rng.choice(len(pitch_types), n_rows, p=[share for share, _, _, _ in SYNTHETIC_PITCH_TYPES.values()])
+    speed, pfx_x, pfx_z = (np.array([values[i] for values in SYNTHETIC_PITCH_TYPES.values()]) for i in range(1, 4))
+    pitch_pitcher = pitcher[pitch_pa]
+
+    #expected stats on balls in play and woba on every plate appearance
+    is_hit = pitch_in_play & np.isin(pitch_events, event_codes(['single', 'double', 'triple', 'home_run']))
+    estimated_ba = np.where(pitch_in_play, np.where(is_hit, rng.beta(6, 4, n_rows), rng.beta(2, 7, n_rows)), np.nan)
+    estimated_woba = np.where(pitch_in_play, estimated_ba * 1.25 + (pitch_events == SAVANT_EVENTS.index('home_run')) * rng.random(n_rows), np.nan)
+    woba_weights = np.zeros(len(SAVANT_EVENTS))
+    woba_weights[event_codes(['walk', 'hit_by_pitch', 'single', 'double', 'triple', 'home_run'])] = [0.69, 0.72, 0.88, 1.25, 1.58, 2.03]
+    woba_value = np.where(last_pitch, woba_weights[pitch_events], np.nan)
+    not_pa = np.isin(pitch_events, event_codes(['sac_bunt', 'catcher_interf', 'caught_stealing_2b', 'caught_stealing_3b', 'pickoff_1b', 'stolen_base_2b']))
+    woba_denom = np.where(last_pitch & ~not_pa, 1.0, np.nan)
+
+    #switch hitters stand on the side opposite the pitcher's hand
+    p_throws = throws[pitch_pitcher - id_base]
+    stand = bats[batter[pitch_pa] - id_base]
+    stand = np.where(stand == 2, 1 - p_throws, stand)
+    team_names = np.array([f'T{team:02d}' for team in range(n_teams)])
+
+    df_savant_raw = pd.DataFrame({
+        'pitch_type': pd.Categorical.from_codes(pitch_type, pitch_types),
+        'game_date': game_date[pa_game][pitch_pa].astype('datetime64[ns]'),
+        'release_speed': (speed[pitch_type] + fastball_offset[pitch_pitcher - id_base] + rng.normal(0, 0.8, n_rows)).round(1),
+        'batter': batter[pitch_pa],
+        'pitcher': pitch_pitcher,
+        'events': pd.Categorical.from_codes(pitch_events, SAVANT_EVENTS),
+        'zone': np.where(rng.random(n_rows) < 0.47, rng.integers(1, 10, n_rows), rng.integers(11, 15, n_rows)),
+        'stand': pd.Categorical.from_codes(stand, ['L', 'R']),
+        'p_throws': pd.Categorical.from_codes(p_throws, ['L', 'R']),
+        'home_team': pd.Categorical.from_codes(game_teams[pa_game[pitch_pa], 1], team_names),
+        'away_team': pd.Categorical.from_codes(game_teams[pa_game[pitch_pa], 0], team_names),
+        'type': pd.Categorical.from_codes(pitch_type_codes, ['B', 'S', 'X']),
+        'bb_type': pd.Categorical.from_codes(bb_type, CONTACT_TYPES),
+        'outs_when_up': outs_when_up[pitch_pa],
+        'inning': inning[pitch_pa],
+        'inning_topbot': pd.Categorical.from_codes(topbot[pitch_pa], ['Top', 'Bot']),
+        'pfx_x': (pfx_x[pitch_type] + rng.normal(0, 0.3, n_rows)).round(2),
+        'pfx_z': (pfx_z[pitch_type] + rng.normal(0, 0.3, n_rows)).round(2),
+        'estimated_ba_using_speedangle': estimated_ba.round(3),
+        'estimated_woba_using_speedangle': estimated_woba.round(3),
+        'woba_value': woba_value,
+        'woba_denom': woba_denom,
+        'game_pk': 700000 + pa_game[pitch_pa],
+        'pitcher_1': pitch_pitcher,
+        **{col: fielders[pitch_pa, i] for i, col in enumerate(FIELDING_COLUMNS[1:])},
+        'at_bat_number': at_bat_number[pitch_pa],
+        'pitch_number': pitch_number,
+        'bat_score': bat_score[pitch_pa],
+        'post_bat_score': bat_score[pitch_pa] + np.where(last_pitch, runs[pitch_pa], 0),
+        'role_key': pd.Categorical.from_codes(np.where(is_starter, 0, 1)[pitch_pa], ['SP', 'RP']),
+        'times_faced': times_faced[pitch_pa],
+        'pitcher_at_bat_number': pitcher_at_bat_number[pitch_pa],
+    })
+
+    #savant exports list the newest game and the last pitch first
+    df_savant_raw = df_savant_raw.iloc[::-1].reset_index(drop=True)
+
+    #people: every rostered player plus inactive people, half of them without an mlb id
+    n_inactive = int(n_ids * inactive_people_ratio)
+    first_year_seen = first_year + first_season
+    birth_year = np.concatenate([first_year_seen - rng.integers(22, 36, n_ids), rng.integers(1900, 1995, n_inactive)])
+    debut_year = np.concatenate([np.maximum(first_year_seen - rng.integers(0, 6, n_ids), birth_year[:n_ids] + 20),
+                                 birth_year[n_ids:] + rng.integers(20, 27, n_inactive)])
+    player_mlb_id = np.concatenate([id_base + np.arange(n_ids), np.where(rng.random(n_inactive) < 0.5, 100000 + np.arange(n_inactive), np.nan)])
+    n_people = n_ids + n_inactive
+
+    df_people = pd.DataFrame({
+        'playerID': [f'syn{i:07d}' for i in range(n_people)],
+        'player_mlb_id': player_mlb_id,
+        'nameFirst': 'First' + pd.Series(np.arange(n_people)).astype(str),
+        'nameLast': 'Last' + pd.Series(np.arange(n_people)).astype(str),
+        'birthYear': birth_year,
+        'debut': pd.Series(rng.integers(4, 10, n_people)).astype(str) + '/' + pd.Series(rng.integers(1, 29, n_people)).astype(str) + '/' + pd.Series(debut_year).astype(str),
+        'bats': np.array(['L', 'R', 'B'])[np.concatenate([bats, rng.choice(3, n_inactive, p=[0.3, 0.6, 0.1])])],
+        'throws': np.array(['L', 'R'])[np.concatenate([throws, rng.choice(2, n_inactive, p=[0.25, 0.75])])],
+    })
+
+    return df_savant_raw, df_people
+
+#best wall time over repeat runs and peak traced memory of one more run
+def measure_call(func, repeat=3):
+    import time
+    import tracemalloc
+
+    best = np.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+
+    #tracemalloc slows the call down, so memory is measured on a separate run
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return best, peak / 2**20, result
+
+#time and memory profile clean_savant_data, every feature stage and the full pipelines on synthetic data
+def run_benchmarks(n_pitches=1_000_000, n_seasons=3, seed=0, repeat=3, results_path='benchmarks/benchmark_results.json', label=None,
+                   parallel_jobs=(1, 2, 4, 8)):
+    """
+    Benchmarks the feature pipeline on generate_synthetic_savant data and appends the 
+    results to a json file, so runs can be compared across commits with 
+    check_benchmark_regressions.
+
+    Every stage of FEATURE_REGISTRY is measured on the df_players its upstream stages 
+    produced. The per-player-game table is built once and measured on its own 
+    ('player_game_table'), like the pipelines share it between their stages. 
+    add_to_df_players_parallel is measured once per worker count in parallel_jobs; the 
+    number of cores of the machine is stored with the run.
+
+    Parameters:
+    -----------
+    n_pitches : int
+        Approximate number of synthetic pitches.
+    n_seasons : int
+        Number of synthetic seasons.
+    seed : int
+        Seed of the synthetic data.
+    repeat : int
+        Timed runs per function; the best one is kept.
+    results_path : str
+        Json file the run is appended to. None to not store the run.
+    label : str, optional
+        Free text stored with the run.
+    parallel_jobs : sequence of int
+        Worker counts to measure add_to_df_players_parallel with.
+
+    Returns:
+    --------
+    pandas.DataFrame
+        'seconds' and 'peak_mb' per benchmark ('clean_savant_data', 'player_game_table', 
+        'stage:<name>', 'add_to_df_players', 'assemble_df_players', 
+        'add_to_df_players_parallel:n_jobs=<n>').
+    """
+    import json
+    import os
+    import subprocess
+    import datetime
+
+    df_savant_raw, df_people = generate_synthetic_savant(n_pitches, n_seasons, seed=seed)
+    df_savant_raw = apply_savant_schema(df_savant_raw)
+    years = sorted(df_savant_raw['game_date'].dt.year.unique())
+    df_players = pd.concat([df_people.assign(year=year) for year in years], ignore_index=True)
+
+    results = {}
+    def record(name, func):
+        seconds, peak_mb, result = measure_call(func, repeat)
+        results[name] = {'seconds': seconds, 'peak_mb': peak_mb}
+        return result
+
+    df_savant, at_bat_ids = record('clean_savant_data', lambda: clean_savant_data(df_savant_raw.copy(deep=False)))
+
+    df_games = record('player_game_table', lambda: build_player_game_table(df_savant))
+
+    df_stage = df_players[df_players['player_mlb_id'].notna()].copy()
+    for name, stage in FEATURE_REGISTRY.items():
+        df_stage = record(f'stage:{name}', lambda: run_profiled_stage(name, stage['func'], df_stage.copy(deep=False), df_savant,
+                                                                       at_bat_ids, df_games))
+
+    for name, func in [('add_to_df_players', add_to_df_players), ('assemble_df_players', assemble_df_players)]:
+        record(name, lambda: func(df_players, df_savant, at_bat_ids))
+
+    for n_jobs in parallel_jobs:
+        record(f'add_to_df_players_parallel:n_jobs={n_jobs}', lambda: add_to_df_players_parallel(df_players, df_savant, at_bat_ids, n_jobs=n_jobs))
+
+    df_results = pd.DataFrame(results).T
+    print(df_results.round(3).to_string())
+
+    if results_path is not None:
+        try:
+            commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            commit = None
+
+        runs = []
+        if os.path.exists(results_path):
+            with open(results_path) as f:
+                runs = json.load(f)
+        runs.append({
+            'commit': commit,
+            'label': label,
+            'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+            'n_pitches': n_pitches,
+            'n_seasons': n_seasons,
+            'seed': seed,
+            'cpus': os.cpu_count(),
+            'pandas': pd.__version__,
+            'numpy': np.__version__,
+            'results': results,
+        })
+
+        if os.path.dirname(results_path):
+            os.makedirs(os.path.dirname(results_path), exist_ok=True)
+        with open(results_path, 'w') as f:
+            json.dump(runs, f, indent=1)
+
+    return df_results
+
+#compare the latest benchmark run with the previous run at the same scale and fail on regressions
+def check_benchmark_regressions(results_path='benchmarks/benchmark_results.json', time_tolerance=0.2, memory_tolerance=0.1,
+                                min_seconds=0.05, min_mb=1.0):
+    """
+    Raises an AssertionError listing every benchmark of the latest run that got slower or 
+    used more memory than in the previous run with the same n_pitches, n_seasons and seed.
+
+    A benchmark regresses when it exceeds the previous value by more than the relative 
+    tolerance and by more than min_seconds / min_mb, so timing noise on fast functions 
+    does not fail the check.
+
+    Returns:
+    --------
+    pandas.DataFrame
+        Previous and latest values and their ratios per benchmark, or None when there is no 
+        earlier run to compare with.
+    """
+    import json
+
+    with open(results_path) as f:
+        runs = json.load(f)
+
+    latest = runs[-1]
+    scale = ['n_pitches', 'n_seasons', 'seed']
+    previous = [run for run in runs[:-1] if all(run[key] == latest[key] for key in scale)]
+    if not previous:
+        print('no earlier benchmark run at this scale to compare with')
+        return None
+
+    df_previous = pd.DataFrame(previous[-1]['results']).T
+    df_latest = pd.DataFrame(latest['results']).T
+    df_compare = df_previous.join(df_latest, lsuffix='_previous', rsuffix='_latest', how='inner')
+    df_compare['time_ratio'] = df_compare['seconds_latest'] / df_compare['seconds_previous']
+    df_compare['memory_ratio'] = df_compare['peak_mb_latest'] / df_compare['peak_mb_previous']
+
+    slower = ((df_compare['time_ratio'] > 1 + time_tolerance)
+              & (df_compare['seconds_latest'] - df_compare['seconds_previous'] > min_seconds))
+    bigger = ((df_compare['memory_ratio'] > 1 + memory_tolerance)
+              & (df_compare['peak_mb_latest'] - df_compare['peak_mb_previous'] > min_mb))
+    df_compare['regression'] = slower | bigger
+
+    print(f"latest run ({latest['commit']}) vs previous run ({previous[-1]['commit']}):")
+    print(df_compare.round(3).to_string())
+
+    #raised explicitly so the gate still fails under python -O
+    if df_compare['regression'].any():
+        raise AssertionError('benchmark regressions: ' + ', '.join(df_compare.index[df_compare['regression']]))
+
+    return df_compare
+
+#fastball velocity given to pitchers without a fastball (mean of the 2021 and 2022 league averages)
+FASTBALL_VELOCITY_FILL = (92.756616 + 92.970260) / 2
+
+#target and columns left out of the playing time models (3.Batting_Model / 3.Pitching_Model)
+#features, hand column, stats that are blended but not regressed and the position of players without one (2.* notebooks)
+PLAYING_TIME_MODELS = {
+    'batter': {
+        'target': 'total_pa',
+        'excluded_columns': ['primary_position', 'babip_batter_reg', 'popups_ratio_batter_reg', 'batter_avg_woba_reg',
+                             'fly_balls_ratio_batter_reg', 'batter_avg_exp_ba_reg'],
+        'features': BATTER_MODEL_FEATURES,
+        'hand': 'bats',
+        'unregressed_columns': ['avg_lineup_position'],
+        'unknown_position': 'Unknown',
+    },
+    'pitcher': {
+        'target': 'total_bf',
+        'excluded_columns': ['primary_position', 'sp_pct', 'babip_pitcher_reg', 'years_after_28', 'pitcher_avg_exp_ba_reg',
+                             'hr_fb_pct_pitcher_reg', 'throws'],
+        'features': PITCHER_MODEL_FEATURES,
+        'hand': 'throws',
+        'unregressed_columns': ['sp_pct'],
+        'unknown_position': 'both_starter_reliever',
+    },
+}
+
+#columns of the feature csvs that are never model inputs
+MODEL_ID_COLUMNS = ['Unnamed: 0', 'player_mlb_id', 'year']
+
+#train the elastic net for one role and bundle everything needed to score new players
+def fit_playing_time_model(df_features, role, alphas=np.logspace(-4, 4, 100), l1_ratio=0.5, cv=10, test_size=0.3,
+                           random_state=42):
+    """
+    Fits the playing time model the way 3.Batting_Model / 3.Pitching_Model do (70/30 split, 
+    standard scaling of the numeric columns fitted on the training rows, drop_first dummies, 
+    10 fold ElasticNetCV) and returns it as a plain dict artifact.
+
+    The artifact fixes the input columns, the scaler mean and scale, the category vocabulary 
+    of every categorical column and the coefficients, so predict_playing_time scores new 
+    seasons with exactly the training transform instead of refitting a scaler and redoing 
+    get_dummies on the new rows.
+
+    Parameters:
+    -----------
+    df_features : pandas.DataFrame
+        Training features with the target column (batter_features.csv / pitcher_features.csv).
+    role : str
+        'batter' or 'pitcher', a key of PLAYING_TIME_MODELS.
+    alphas, l1_ratio, cv : 
+        Passed to ElasticNetCV.
+    test_size, random_state :
+        Passed to train_test_split.
+
+    Returns:
+    --------
+    dict
+        The model artifact, with the held out 'rmse' and 'r2' and the cross validated 'cv_rmse' 
+        of the selected alpha and l1_ratio.
+    """
+    from sklearn.linear_model import ElasticNetCV
+    from sklearn.metrics import mean_squared_error, r2_score
+
+    X_train, X_test, y_train, y_test = playing_time_training_split(df_features, role, test_size, random_state)
+
+    numeric_columns = X_train.select_dtypes(include=np.number).columns.tolist()
+    categorical_columns = [col for col in X_train.columns if col not in numeric_columns]
+
+    #StandardScaler statistics (population std, constant columns keep a scale of 1)
+    numeric_mean = X_train[numeric_columns].to_numpy(dtype=float).mean(axis=0)
+    numeric_scale = X_train[numeric_columns].to_numpy(dtype=float).std(axis=0)
+    numeric_scale[numeric_scale == 0] = 1.0
+
+    #get_dummies order: sorted categories of the training rows, the first one dropped
+    categories = {col: sorted(X_train[col].dropna().unique().tolist()) for col in categorical_columns}
+
+    artifact = {
+        'role': role,
+        'target': PLAYING_TIME_MODELS[role]['target'],
+        'test_size': test_size,
+        'random_state': random_state,
+        'numeric_columns': numeric_columns,
+        'numeric_mean': numeric_mean,
+        'numeric_scale': numeric_scale,
+        'categories': categories,
+        'design_columns': numeric_columns + [f'{col}_{value}' for col in categorical_columns for value in categories[col][1:]],
+    }
+
+    model = ElasticNetCV(cv=cv, random_state=random_state, alphas=alphas, l1_ratio=l1_ratio, max_iter=10000, tol=1e-4)
+    model.fit(playing_time_design_matrix(artifact, X_train), y_train)
+
+    artifact.update({
+        'coef': model.coef_,
+        'intercept': float(model.intercept_),
+        'alpha': float(model.alpha_),
+        'l1_ratio': float(model.l1_ratio_),
+    })
+
+    y_pred = predict_playing_time(artifact, X_test)
+    artifact['rmse'] = float(np.sqrt(mean_squared_error(y_test, y_pred)))
+    artifact['r2'] = float(r2_score(y_test, y_pred))
+    artifact['cv_rmse'] = float(np.sqrt(model.mse_path_.mean(axis=-1).min()))
+
+    return artifact
+
+#model inputs and target of a feature table, split like the model notebooks
+def playing_time_training_split(df_features, role, test_size=0.3, random_state=42):
+    from sklearn.model_selection import train_test_split
+
+    if role not in PLAYING_TIME_MODELS:
+        raise ValueError(f'role must be one of {list(PLAYING_TIME_MODELS)}, got {role!r}')
+    config = PLAYING_TIME_MODELS[role]
+
+    excluded = set(MODEL_ID_COLUMNS) | set(config['excluded_columns']) | {config['target']}
+    X = df_features[[col for col in df_features.columns if col not in excluded]]
+    y = df_features[config['target']].to_numpy(dtype=float)
+
+    return train_test_split(X, y, test_size=test_size, random_state=random_state)
+
+#scaled numeric columns followed by the drop_first dummies of the artifact vocabulary
+def playing_time_design_matrix(artifact, df_features):
+    missing = [col for col in artifact['numeric_columns'] + list(artifact['categories']) if col not in df_features.columns]
+    if missing:
+        raise ValueError(f'columns missing for the {artifact["role"]} model: {missing}')
+
+    numeric = df_features[artifact['numeric_columns']].to_numpy(dtype=float)
+    if np.isnan(numeric).any():
+        raise ValueError(f'missing values in {np.array(artifact["numeric_columns"])[np.isnan(numeric).any(axis=0)].tolist()}')
+
+    blocks = [(numeric - artifact['numeric_mean']) / artifact['numeric_scale']]
+    for col, values in artifact['categories'].items():
+        #categories not seen in training get code -1 and, like the dropped first category, all zeros
+        codes = pd.Categorical(df_features[col], categories=values).codes
+        blocks.append((codes[:, None] == np.arange(1, len(values))).astype(float))
+
+    return np.hstack(blocks)
+
+#vectorized batch prediction from a model artifact
+def predict_playing_time(artifact, df_features):
+    """
+    Predicts PA (batter artifact) or BF (pitcher artifact) for every row of df_features, 
+    clipped at 0 like the notebooks. Extra columns (ids, the target) are ignored.
+    """
+    X = playing_time_design_matrix(artifact, df_features)
+
+    return np.maximum(X @ artifact['coef'] + artifact['intercept'], 0)
+
+#write a model artifact as json
+def save_playing_time_model(artifact, path):
+    import json
+
+    with open(path, 'w') as f:
+        json.dump({key: value.tolist() if isinstance(value, np.ndarray) else value for key, value in artifact.items()}, f)
+
+#read a model artifact written by save_playing_time_model
+def load_playing_time_model(path):
+    import json
+
+    with open(path) as f:
+        artifact = json.load(f)
+    for key in ['numeric_mean', 'numeric_scale', 'coef', 'bootstrap_coef', 'bootstrap_intercept', 'residuals']:
+        if key in artifact:
+            artifact[key] = np.asarray(artifact[key], dtype=float)
+
+    return artifact
+
+#training design matrix, target and artifact shared with the forked bootstrap workers
+BOOTSTRAP_SHARED = {}
+
+#refit the elastic net at the selected alpha and l1_ratio for a block of bootstrap resamples
+def fit_bootstrap_resamples(sample_counts):
+    from sklearn.linear_model import ElasticNet
+
+    X = BOOTSTRAP_SHARED['X']
+    y = BOOTSTRAP_SHARED['y']
+    artifact = BOOTSTRAP_SHARED['artifact']
+
+    model = ElasticNet(alpha=artifact['alpha'], l1_ratio=artifact['l1_ratio'], max_iter=10000, tol=1e-4, warm_start=True)
+    coefs = np.empty((len(sample_counts), X.shape[1]))
+    intercepts = np.empty(len(sample_counts))
+    for i, counts in enumerate(sample_counts):
+        #start every refit from the full sample solution, a resample is only a small step away
+        model.coef_ = artifact['coef'].copy()
+        model.intercept_ = artifact['intercept']
+        #a row drawn k times is the same as a row with weight k
+        model.fit(X, y, sample_weight=counts)
+        coefs[i] = model.coef_
+        intercepts[i] = model.intercept_
+
+    return coefs, intercepts
+
+#bootstrap the coefficients of a playing time model for prediction intervals
+def bootstrap_playing_time_model(artifact, df_features, n_resamples=500, seed=0, n_jobs=None):
+    """
+    Adds bootstrap coefficients to a model artifact so predict_playing_time_intervals can 
+    give P10 / P50 / P90 projections.
+
+    The training rows of fit_playing_time_model (same split, same scaler and dummies) are 
+    resampled with replacement n_resamples times, drawn at once as a matrix of row counts, 
+    and the elastic net is refitted on each resample at the alpha and l1_ratio already 
+    selected by cross validation, passing the counts as sample weights and warm starting from 
+    the full sample coefficients. The resamples are split into blocks fitted on forked 
+    workers. The training residuals of the full model are kept to add the noise of a single 
+    season on top of the coefficient uncertainty.
+
+    Parameters:
+    -----------
+    artifact : dict
+        Output of fit_playing_time_model (or load_playing_time_model).
+    df_features : pandas.DataFrame
+        The feature table the artifact was fitted on.
+    n_resamples : int
+        Number of bootstrap resamples.
+    seed : int
+        Seed of the resampling.
+    n_jobs : int, optional
+        Number of worker processes. Defaults to the number of cores.
+
+    Returns:
+    --------
+    dict
+        Copy of the artifact with 'bootstrap_coef' (n_resamples x features), 
+        'bootstrap_intercept' and 'residuals'. save_playing_time_model stores them too.
+    """
+    import multiprocessing
+    import os
+
+    X_train, _, y_train, _ = playing_time_training_split(df_features, artifact['role'], artifact['test_size'],
+                                                         artifact['random_state'])
+    X = playing_time_design_matrix(artifact, X_train)
+
+    rng = np.random.default_rng(seed)
+    sample_counts = rng.multinomial(len(X), np.full(len(X), 1 / len(X)), size=n_resamples).astype(float)
+
+    n_jobs = min(n_jobs or os.cpu_count(), n_resamples)
+    use_pool = n_jobs > 1 and 'fork' in multiprocessing.get_all_start_methods()
+    blocks = np.array_split(sample_counts, n_jobs)
+
+    BOOTSTRAP_SHARED.update({'X': X, 'y': y_train, 'artifact': artifact})
+    try:
+        if use_pool:
+            with multiprocessing.get_context('fork').Pool(n_jobs) as pool:
+                results = pool.map(fit_bootstrap_resamples, blocks)
+        else:
+            results = [fit_bootstrap_resamples(block) for block in blocks]
+    finally:
+        BOOTSTRAP_SHARED.clear()
+
+    artifact = dict(artifact)
+    artifact['bootstrap_coef'] = np.vstack([coefs for coefs, _ in results])
+    artifact['bootstrap_intercept'] = np.concatenate([intercepts for _, intercepts in results])
+    artifact['residuals'] = y_train - (X @ artifact['coef'] + artifact['intercept'])
+
+    return artifact
+
+#one simulated PA / BF per bootstrap resample for every row (rows x resamples)
+def predict_playing_time_samples(artifact, df_features, seed=0):
+    if 'bootstrap_coef' not in artifact:
+        raise ValueError('the artifact has no bootstrap coefficients, run bootstrap_playing_time_model first')
+
+    X = playing_time_design_matrix(artifact, df_features)
+    samples = X @ artifact['bootstrap_coef'].T + artifact['bootstrap_intercept']
+
+    rng = np.random.default_rng(seed)
+    samples += rng.choice(artifact['residuals'], size=samples.shape)
+
+    return np.maximum(samples, 0)
+
+#P10 / P50 / P90 projections from a bootstrapped artifact
+def predict_playing_time_intervals(artifact, df_features, quantiles=(0.1, 0.5, 0.9), seed=0):
+    """
+    Quantiles of predict_playing_time_samples, one column per quantile ('P10', 'P50', 
+    'P90'), indexed like df_features.
+    """
+    samples = predict_playing_time_samples(artifact, df_features, seed)
+
+    return pd.DataFrame(np.quantile(samples, quantiles, axis=1).T, index=df_features.index,
+                        columns=[f'P{round(q * 100)}' for q in quantiles])
+
+#score batters and pitchers and add their PA and BF into the PLAYING_TIME table
+def predict_playing_time_table(batter_model, pitcher_model, df_batters, df_pitchers, player_ids=None, quantiles=None, seed=0):
+    """
+    Combines the batter and pitcher predictions the way 3.Pitching_Model does: an outer 
+    join on the player, 0 for the role a player has no prediction in, and 
+    PLAYING_TIME = PA + BF.
+
+    Parameters:
+    -----------
+    batter_model, pitcher_model : dict
+        Artifacts from fit_playing_time_model or load_playing_time_model.
+    df_batters, df_pitchers : pandas.DataFrame
+        Features of the season to predict (batter_features_final_model.csv / 
+        pitcher_features_final_model.csv), with player_mlb_id.
+    player_ids : array-like, optional
+        Players of the submission (PLAYER_ID of sample_submission.csv). The table is 
+        returned in that order, with NaN for players without any prediction.
+    quantiles : list of float, optional
+        Also add PLAYING_TIME_P10 / _P50 / _P90 (for quantiles 0.1, 0.5, 0.9) from 
+        bootstrapped artifacts (bootstrap_playing_time_model). The PA and BF samples of the 
+        same resample are added before taking the quantiles, so two way players get the 
+        interval of their total.
+    seed : int
+        Seed of the residual draws.
+
+    Returns:
+    --------
+    pandas.DataFrame
+        PLAYER_ID, predicted_pa, predicted_bf and PLAYING_TIME (and the quantile columns).
+    """
+    df_pa = pd.DataFrame({'PLAYER_ID': df_batters['player_mlb_id'].to_numpy(),
+                          'predicted_pa': predict_playing_time(batter_model, df_batters)})
+    df_bf = pd.DataFrame({'PLAYER_ID': df_pitchers['player_mlb_id'].to_numpy(),
+                          'predicted_bf': predict_playing_time(pitcher_model, df_pitchers)})
+
+    df_table = df_pa.merge(df_bf, on='PLAYER_ID', how='outer')
+    df_table[['predicted_pa', 'predicted_bf']] = df_table[['predicted_pa', 'predicted_bf']].fillna(0)
+    df_table['PLAYING_TIME'] = df_table['predicted_pa'] + df_table['predicted_bf']
+
+    if quantiles is not None:
+        n_resamples = min(len(batter_model['bootstrap_intercept']), len(pitcher_model['bootstrap_intercept']))
+        samples = np.zeros((len(df_table), n_resamples))
+        for model, df_role, role_seed in [(batter_model, df_batters, seed), (pitcher_model, df_pitchers, seed + 1)]:
+            rows = pd.Index(df_table['PLAYER_ID']).get_indexer(df_role['player_mlb_id'])
+            np.add.at(samples, rows, predict_playing_time_samples(model, df_role, role_seed)[:, :n_resamples])
+        for q, values in zip(quantiles, np.quantile(samples, quantiles, axis=1)):
+            df_table[f'PLAYING_TIME_P{round(q * 100)}'] = values
+
+    if player_ids is not None:
+        df_table = pd.DataFrame({'PLAYER_ID': player_ids}).merge(df_table, on='PLAYER_ID', how='left')
+
+    return df_table
+
+#per player season model features and position baselines, computed once for every tuning trial
+def build_tuning_cache(df_players, role):
+    """
+    Prepares the expensive, constant part of the 2.* feature notebooks: the per player 
+    season aggregates of df_players restricted to the role's model features (infinite 
+    ratios set to 1, pitchers' position replaced by their starter / reliever role) and the 
+    playing time weighted baselines per year and position, with the league baseline for 
+    unknown positions.
+
+    Parameters:
+    -----------
+    df_players : pandas.DataFrame
+        Output of add_to_df_players / assemble_df_players (or the df_players.csv it was saved to).
+    role : str
+        'batter' or 'pitcher'.
+
+    Returns:
+    --------
+    dict
+        'role', 'stat_cols', 'df_seasons' and 'group_means' for playing_time_training_table.
+    """
+    if role not in PLAYING_TIME_MODELS:
+        raise ValueError(f'role must be one of {list(PLAYING_TIME_MODELS)}, got {role!r}')
+    config = PLAYING_TIME_MODELS[role]
+    weight_col = config['target']
+
+    df_seasons = df_players.loc[df_players[weight_col] > 0, config['features']].replace(np.inf, 1)
+
+    if role == 'pitcher':
+        #position players who pitched are left out, pitchers are grouped by their role
+        df_seasons = df_seasons[df_seasons['primary_position'] == 'p']
+        df_seasons['primary_position'] = np.select(
+            [df_seasons['starter'] == 1, df_seasons['reliever'] == 1, df_seasons['both_starter_reliever'] == 1],
+            ['starter', 'reliever', 'both_starter_reliever'],
+            default='unknown'
+        )
+        df_seasons = df_seasons.drop(columns=['starter', 'reliever', 'both_starter_reliever'])
+    df_seasons = df_seasons.reset_index(drop=True)
+
+    stat_cols = [col for col in df_seasons.select_dtypes(include=np.number).columns
+                 if col not in ['player_mlb_id', 'year', 'age', 'years_after_28', weight_col]]
+
+    group_means = weighted_group_means(df_seasons, stat_cols, weight_col, by=['year', 'primary_position']).fillna(0)
+    league_means = weighted_group_means(df_seasons, stat_cols, weight_col, by='year')
+    unknown = group_means.index.get_level_values('primary_position') == 'Unknown'
+    group_means.loc[unknown, stat_cols] = league_means.loc[group_means.index[unknown].get_level_values('year'), stat_cols].to_numpy()
+
+    return {'role': role, 'stat_cols': stat_cols, 'df_seasons': df_seasons, 'group_means': group_means}
+
+#model table for one target year from the tuning cache (the cheap blend and regression steps)
+def playing_time_training_table(cache, season_weights=(5, 3), regression_weight=5, fastball_fill=FASTBALL_VELOCITY_FILL,
+                                target_year=None):
+    """
+    Builds the table of batter_features.csv / pitcher_features.csv for one target year.
+
+    The seasons before target_year are blended with season_weights, the blended stats are 
+    regressed toward the mean of their position over those seasons by regression_weight 
+    PA / BF (columns '<stat>_reg'), and the stats in unregressed_columns keep their blend 
+    ('<stat>_') next to the position mean ('<stat>'), like the notebooks. The target is the 
+    playing time in target_year, 0 for players without it.
+
+    Parameters:
+    -----------
+    cache : dict
+        Output of build_tuning_cache.
+    season_weights : sequence of float
+        Weights of the previous seasons, most recent first.
+    regression_weight : float
+        PA / BF worth of the position mean added to every player.
+    fastball_fill : float
+        avg_fb_vel of pitchers without a fastball.
+    target_year : int, optional
+        Season to predict. Defaults to the last season of the cache.
+
+    Returns:
+    --------
+    pandas.DataFrame
+        One row per player with playing time in at least one of the blended seasons.
+    """
+    config = PLAYING_TIME_MODELS[cache['role']]
+    weight_col = config['target']
+    stat_cols = cache['stat_cols']
+    df_seasons = cache['df_seasons']
+
+    if target_year is None:
+        target_year = int(df_seasons['year'].max())
+    window_years = target_year - np.arange(1, len(season_weights) + 1)
+    df_window = df_seasons[df_seasons['year'].isin(window_years)].copy()
+
+    if 'avg_fb_vel' in stat_cols:
+        df_window['avg_fb_vel'] = df_window['avg_fb_vel'].fillna(fastball_fill)
+    df_window[stat_cols] = df_window[stat_cols].fillna(0)
+
+    if cache['role'] == 'batter':
+        #pitchers are left out since the universal DH, unless they got over 200 PA in a season (Shohei)
+        is_pitcher = df_window['primary_position'].eq('p').groupby(df_window['player_mlb_id']).transform('any')
+        over_200 = df_window[weight_col].gt(200).groupby(df_window['player_mlb_id']).transform('any')
+        df_window = df_window[~is_pitcher | over_200]
+
+    df_table = blend_seasons(df_window, stat_cols, weight_col, weights=season_weights, target_years=[target_year])
+
+    #age and hand from the most recent season, moved forward to the last season before the target year
+    df_latest = df_window.sort_values('year').drop_duplicates('player_mlb_id', keep='last').set_index('player_mlb_id')
+    df_latest = df_latest.reindex(df_table['player_mlb_id'])
+    years_ahead = target_year - 1 - df_latest['year'].to_numpy()
+    df_table['age'] = df_latest['age'].to_numpy() + years_ahead
+    df_table['years_after_28'] = df_latest['years_after_28'].to_numpy() + years_ahead
+    df_table['primary_position'] = df_latest['primary_position'].fillna(config['unknown_position']).to_numpy()
+    df_table[config['hand']] = df_latest[config['hand']].to_numpy()
+
+    #position means over the blended seasons
+    group_means = cache['group_means']
+    position_means = group_means[group_means.index.get_level_values('year').isin(window_years)].groupby(level='primary_position').mean()
+
+    regressed = [col for col in stat_cols if col not in config['unregressed_columns']]
+    df_regressed = regress_to_group_mean(df_table, regressed, weight_col, position_means, 'primary_position', regression_weight)
+
+    df_target = df_seasons.loc[df_seasons['year'] == target_year, ['player_mlb_id', weight_col]]
+    target = df_table[['player_mlb_id']].merge(df_target, on='player_mlb_id', how='left')[weight_col].fillna(0).to_numpy()
+
+    df_features = pd.DataFrame({
+        'player_mlb_id': df_table['player_mlb_id'],
+        'year': df_table['year'],
+        weight_col: target,
+        'age': df_table['age'],
+        'years_after_28': df_table['years_after_28'],
+        'primary_position': df_table['primary_position'],
+        config['hand']: df_table[config['hand']],
+    })
+    for col in config['unregressed_columns']:
+        df_features[col + '_'] = df_table[col]
+    df_features[weight_col + '_'] = df_table[weight_col]
+    for col in config['unregressed_columns']:
+        df_features[col] = position_means[col].reindex(df_table['primary_position']).to_numpy()
+    for col in regressed:
+        df_features[col + '_reg'] = df_regressed[col]
+
+    return df_features
+
+#cache shared with the forked workers of tune_playing_time_model (set before the pool starts)
+TUNING_SHARED = {}
+
+#build the table for one set of feature constants and fit the whole alpha / l1_ratio grid on it
+def run_tuning_trial(season_weights, regression_weight, fastball_fill, alphas, l1_ratios, cv, target_year):
+    cache = TUNING_SHARED['cache']
+    df_table = playing_time_training_table(cache, season_weights, regression_weight,
+                                           FASTBALL_VELOCITY_FILL if fastball_fill is None else fastball_fill, target_year)
+    artifact = fit_playing_time_model(df_table, cache['role'], alphas=alphas, l1_ratio=l1_ratios, cv=cv)
+
+    return {
+        'season_weights': tuple(season_weights),
+        'regression_weight': regression_weight,
+        'fastball_fill': fastball_fill,
+        'alpha': artifact['alpha'],
+        'l1_ratio': artifact['l1_ratio'],
+        'cv_rmse': artifact['cv_rmse'],
+        'test_rmse': artifact['rmse'],
+        'test_r2': artifact['r2'],
+        'rows': len(df_table),
+    }
+
+#grid or random search over the feature constants and the elastic net hyperparameters
+def tune_playing_time_model(cache, season_weights=((5, 3),), regression_weights=(5,), fastball_fills=(FASTBALL_VELOCITY_FILL,),
+                            alphas=np.logspace(-4, 4, 100), l1_ratios=(0.1, 0.5, 0.9), cv=10, n_trials=None, seed=0,
+                            n_jobs=None, target_year=None):
+    """
+    Searches the season weights, the regression constant and the fastball velocity fill 
+    together with the ElasticNet alphas and l1_ratio, without touching the pitch data.
+
+    Each trial is one combination of the feature constants: it rebuilds the model table 
+    from the tuning cache (a blend and a regression) and fits ElasticNetCV once, which walks 
+    the whole alpha path for every l1_ratio with warm starts from one alpha to the next, so 
+    the model grid costs one regularization path per l1_ratio and fold instead of one fit 
+    per alpha. Trials run on a pool of forked workers that share the cache.
+
+    Parameters:
+    -----------
+    cache : dict
+        Output of build_tuning_cache.
+    season_weights : list of tuples
+        Candidate season weights, most recent season first.
+    regression_weights : list of float
+        Candidate PA / BF worth of the position mean.
+    fastball_fills : list of float
+        Candidate avg_fb_vel fills (ignored for batters).
+    alphas, l1_ratios :
+        ElasticNet grid searched inside every trial.
+    cv : int
+        Cross validation folds.
+    n_trials : int, optional
+        Evaluate this many random combinations of the feature constants instead of the full grid.
+    seed : int
+        Seed of the random search.
+    n_jobs : int, optional
+        Number of worker processes. Defaults to the number of cores.
+    target_year : int, optional
+        Season to predict, passed to playing_time_training_table.
+
+    Returns:
+    --------
+    pandas.DataFrame
+        One row per trial with its constants, the selected alpha and l1_ratio, the cross 
+        validated RMSE and the held out RMSE / R², best cross validated RMSE first.
+    """
+    import itertools
+    import multiprocessing
+    import os
+
+    if 'avg_fb_vel' not in cache['stat_cols']:
+        fastball_fills = [None]
+
+    grid = list(itertools.product(season_weights, regression_weights, fastball_fills))
+    if n_trials is not None and n_trials < len(grid):
+        rng = np.random.default_rng(seed)
+        grid = [grid[i] for i in sorted(rng.choice(len(grid), n_trials, replace=False))]
+
+    alphas = np.sort(np.asarray(alphas, dtype=float))[::-1]
+    tasks = [(weights, regression_weight, fill, alphas, list(l1_ratios), cv, target_year)
+             for weights, regression_weight, fill in grid]
+
+    n_jobs = n_jobs or os.cpu_count()
+    use_pool = n_jobs > 1 and len(tasks) > 1 and 'fork' in multiprocessing.get_all_start_methods()
+
+    TUNING_SHARED['cache'] = cache
+    try:
+        if use_pool:
+            with multiprocessing.get_context('fork').Pool(min(n_jobs, len(tasks))) as pool:
+                trials = pool.starmap(run_tuning_trial, tasks)
+        else:
+            trials = [run_tuning_trial(*task) for task in tasks]
+    finally:
+        TUNING_SHARED.clear()
+
+    return pd.DataFrame(trials).sort_values('cv_rmse').reset_index(drop=True)
+
+#least squares fit of every column of X against every column of Y, each pair on the rows where both are valid
+def pairwise_linear_fits(X, Y, x_valid, y_valid):
+    from scipy import stats
+
+    #shift every column to its mean first so the sums of squares do not lose precision
+    x_shift = np.nanmean(np.where(x_valid, X, np.nan), axis=0)
+    y_shift = np.nanmean(np.where(y_valid, Y, np.nan), axis=0)
+    Xc = np.where(x_valid, X - np.nan_to_num(x_shift), 0)
+    Yc = np.where(y_valid, Y - np.nan_to_num(y_shift), 0)
+    mx = x_valid.astype(float)
+    my = y_valid.astype(float)
+
+    #pair sums over the rows valid in both columns, as matrix products
+    n = mx.T @ my
+    sx = Xc.T @ my
+    sy = mx.T @ Yc
+    sxx = (Xc ** 2).T @ my
+    syy = mx.T @ (Yc ** 2)
+    sxy = Xc.T @ Yc
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean_x = sx / n
+        mean_y = sy / n
+        ssx = sxx - n * mean_x ** 2
+        ssy = syy - n * mean_y ** 2
+        sxy = sxy - n * mean_x * mean_y
+
+        slope = sxy / ssx
+        intercept = (mean_y + np.nan_to_num(y_shift)) - slope * (mean_x + np.nan_to_num(x_shift)[:, None])
+        r = np.clip(sxy / np.sqrt(ssx * ssy), -1, 1)
+        dof = n - 2
+        t = r * np.sqrt(dof / ((1 - r) * (1 + r)))
+        p_value = 2 * stats.t.sf(np.abs(t), dof)
+        stderr = np.sqrt((1 - r ** 2) * ssy / ssx / dof)
+
+    #a column that is constant on the pair's rows has no regression line (up to rounding of the sums)
+    constant = (ssx <= 1e-10 * sxx) | (ssy <= 1e-10 * syy)
+    for values in [slope, intercept, r, p_value, stderr]:
+        values[constant] = np.nan
+
+    return {'n': n, 'slope': slope, 'intercept': intercept, 'r': r, 'p_value': p_value, 'stderr': stderr}
+
+#rank linear relationships of every feature with the playing time targets (and optionally between features)
+def screen_linear_relationships(df, targets=('total_pa', 'total_bf'), features=None, all_pairs=False, min_x=None, min_y=None,
+                                min_n=10):
+    """
+    Bulk version of linear_regression_scatter: scipy.stats.linregress for every (feature, 
+    target) pair, and every pair of features with all_pairs, in one vectorized pass.
+
+    Each pair is fitted on its own rows: those where both columns are present and finite 
+    and, like linear_regression_scatter, where x >= min_x and y >= min_y.
+
+    Parameters:
+    -----------
+    df : pandas.DataFrame
+        Player season data, e.g. df_players.
+    targets : list of str
+        y columns.
+    features : list of str, optional
+        x columns. Defaults to every numeric column except the targets and the ids.
+    all_pairs : bool
+        Also fit every pair of features (the earlier column of features as x).
+    min_x, min_y : float, optional
+        Minimum x and y value of the rows used.
+    min_n : int
+        Pairs with fewer rows are left out.
+
+    Returns:
+    --------
+    pandas.DataFrame
+        x, y, n, slope, intercept, r, r2, p_value and stderr per pair, strongest |r| first.
+    """
+    targets = list(targets)
+    missing = [col for col in targets if col not in df.columns]
+    if missing:
+        raise ValueError(f'target columns not in df: {missing}')
+    if features is None:
+        features = [col for col in df.select_dtypes(include=np.number).columns if col not in targets and col not in MODEL_ID_COLUMNS]
+
+    def valid_values(columns, minimum):
+        values = df[columns].to_numpy(dtype=float)
+        valid = np.isfinite(values)
+        if minimum is not None:
+            valid &= values >= minimum
+        return values, valid
+
+    X, x_valid = valid_values(features, min_x)
+    Y, y_valid = valid_values(targets, min_y)
+    fits = [(pairwise_linear_fits(X, Y, x_valid, y_valid), np.ones((len(features), len(targets)), dtype=bool), targets)]
+
+    if all_pairs:
+        Y_features, y_features_valid = valid_values(features, min_y)
+        fits.append((pairwise_linear_fits(X, Y_features, x_valid, y_features_valid),
+                     np.triu(np.ones((len(features), len(features)), dtype=bool), k=1), features))
+
+    frames = []
+    for fit, keep, y_columns in fits:
+        rows, cols = np.nonzero(keep & (fit['n'] >= min_n))
+        df_fit = pd.DataFrame({'x': np.array(features, dtype=object)[rows], 'y': np.array(y_columns, dtype=object)[cols]})
+        for stat in ['n', 'slope', 'intercept', 'r', 'p_value', 'stderr']:
+            df_fit[stat] = fit[stat][rows, cols]
+        frames.append(df_fit)
+
+    df_screen = pd.concat(frames, ignore_index=True)
+    df_screen['n'] = df_screen['n'].astype(int)
+    df_screen.insert(df_screen.columns.get_loc('r') + 1, 'r2', df_screen['r'] ** 2)
+
+    return df_screen.dropna(subset=['r']).sort_values('r', key=np.abs, ascending=False).reset_index(drop=True)
+
+#function to create linear regressions
+def linear_regression_scatter(df, x, y, min_x=False, min_y=False):
     
-    #create dataframe for each at bat
-    at_bat_ids = df_savant_raw[['batter','pitcher','game_date','year','times_faced']].drop_duplicates()
+    #filter entries to where columns aren't null
+    df = df[df[x].notnull() & df[y].notnull()]
+
+    #filter out player who do not meet the min
+    if min_x != False:
+        df = df[df[x] >= min_x]
     
-    #assign a unique id to each at bat
-    at_bat_ids['at_bat_id'] = range(1, len(at_bat_ids) + 1)
+    if min_y != False:
+        df = df[df[y] >= min_y]
     
-    #add unique ids to original savant data
-    df_savant = df_savant_raw.merge(at_bat_ids, on=['batter','pitcher','game_date','year','times_faced'],how='inner')
-
-    return df_savant, at_bat_ids
+    #get passed columns 
+    x_vals = df[x]
+    y_vals = df[y]
+    
+    #perform linear regression
+    from scipy import stats
+    slope, intercept, r, p, std_err = stats.linregress(x_vals, y_vals)
+    
+    #create scatter plot with regression line
+    plt.figure(figsize=(10, 6))  # Increase figure size for better readability
+    sns.set_theme(style="whitegrid")  # Use a clean theme
+    
+    #scatter plot
+    sns.scatterplot(x=x_vals, y=y_vals, color="blue", alpha=0.6, s=60, label="Player Data")
+    
+    #regression line
+    plt.plot(x_vals, slope * x_vals + intercept, color="red", linewidth=2, label=f"Regression Line (a: {slope:.2f}, b: {intercept:.2f}, R²={r**2:.2f})")
+    
+    #add text and plot
+    plt.title(f"Relationship Between {x} and {y}", fontsize=16)
+    plt.xlabel(f"{x}", fontsize=14)
+    plt.ylabel(f"{y}", fontsize=14)
+    plt.legend(fontsize=12)
+    plt.tight_layout()
+    plt.show()
+
+#scatter plots of the k strongest pairs of a screen
+def plot_top_relationships(df, df_screen, k=5, min_x=False, min_y=False):
+    for x, y in df_screen[['x', 'y']].head(k).itertuples(index=False):
+        linear_regression_scatter(df, x, y, min_x, min_y)
+
+#python 0.functions.py runs the benchmarks and exits non-zero on a regression
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Benchmark the savant feature pipeline on synthetic data.')
+    parser.add_argument('--n-pitches', type=int, default=1_000_000)
+    parser.add_argument('--seasons', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--results', default='benchmarks/benchmark_results.json')
+    parser.add_argument('--label')
+    args = parser.parse_args()
+
+    run_benchmarks(args.n_pitches, args.seasons, seed=args.seed, repeat=args.repeat, results_path=args.results, label=args.label)
+    check_benchmark_regressions(args.results)
@@ -0,0 +1,82 @@
+import importlib.util
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+#0.functions.py is not importable by name, load it from its path
+spec = importlib.util.spec_from_file_location('functions', os.path.join(os.path.dirname(__file__), '..', '0.functions.py'))
+functions = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(functions)
+
+
+@pytest.fixture(scope='module')
+def df_savant_raw():
+    df_raw, _ = functions.generate_synthetic_savant(n_pitches=30_000, n_seasons=2, seed=1)
+    return df_raw
+
+
+def at_bat_keys(df_raw, at_bat_key):
+    df_raw = df_raw.copy()
+    df_raw['row_number'] = np.arange(len(df_raw))
+    df_savant, at_bat_ids = functions.clean_savant_data(df_raw, at_bat_key)
+    return df_savant.set_index('row_number')['at_bat_id'].sort_index(), at_bat_ids
+
+
+def same_partition(ids_a, ids_b):
+    ids = pd.DataFrame({'a': ids_a, 'b': ids_b})
+    return (ids.groupby('a')['b'].nunique() == 1).all() and (ids.groupby('b')['a'].nunique() == 1).all()
+
+
+def test_factorize_gives_the_merge_ids(df_savant_raw):
+    merge_ids, merge_lookup = at_bat_keys(df_savant_raw, 'merge')
+    factorize_ids, factorize_lookup = at_bat_keys(df_savant_raw, 'factorize')
+
+    assert len(merge_ids) == len(factorize_ids) == len(df_savant_raw)
+    assert (merge_ids.to_numpy() == factorize_ids.to_numpy()).all()
+    assert len(factorize_lookup) == len(merge_lookup)
+    assert factorize_lookup['at_bat_id'].is_unique
+
+
+def test_game_keys_partition_like_merge(df_savant_raw):
+    #the synthetic data has no doubleheaders and no pitching changes during a plate appearance
+    merge_ids, _ = at_bat_keys(df_savant_raw, 'merge')
+    game_ids, game_lookup = at_bat_keys(df_savant_raw, 'game')
+
+    assert same_partition(merge_ids, game_ids)
+    assert game_lookup['at_bat_id'].is_unique and len(game_lookup) == game_ids.nunique()
+
+
+def test_game_keys_separate_doubleheaders(df_savant_raw):
+    #replay one game under a new game_pk on the same date
+    game_pk = df_savant_raw['game_pk'].iloc[0]
+    df_second = df_savant_raw[df_savant_raw['game_pk'] == game_pk].assign(game_pk=df_savant_raw['game_pk'].max() + 1)
+    df_raw = pd.concat([df_savant_raw, df_second], ignore_index=True)
+
+    merge_ids, _ = at_bat_keys(df_raw, 'merge')
+    factorize_ids, _ = at_bat_keys(df_raw, 'factorize')
+    game_ids, _ = at_bat_keys(df_raw, 'game')
+
+    assert (merge_ids.to_numpy() == factorize_ids.to_numpy()).all()
+    assert game_ids.nunique() == merge_ids.nunique() + df_second[['game_pk', 'at_bat_number']].drop_duplicates().shape[0]
+
+
+def test_game_keys_merge_a_pitching_change_during_an_at_bat(df_savant_raw):
+    #hand the last pitch of an at bat with several pitches to a pitcher who is not in that game
+    df_raw = df_savant_raw.copy()
+    pitches = df_raw.groupby(['game_pk', 'at_bat_number'])['pitch_number'].transform('size')
+    row = np.flatnonzero(pitches.to_numpy() > 1)[0]
+    df_raw['pitcher'] = df_raw['pitcher'].astype(np.int64)
+    df_raw.loc[row, 'pitcher'] = df_raw['pitcher'].max() + 1
+
+    merge_ids, _ = at_bat_keys(df_raw, 'merge')
+    factorize_ids, _ = at_bat_keys(df_raw, 'factorize')
+    game_ids, _ = at_bat_keys(df_raw, 'game')
+
+    assert (merge_ids.to_numpy() == factorize_ids.to_numpy()).all()
+    assert merge_ids.nunique() == game_ids.nunique() + 1
+
+
+def test_check_at_bat_keying(df_savant_raw):
+    assert functions.check_at_bat_keying(df_savant_raw, 'factorize')